@@ -36,13 +36,20 @@ status_message = None
 async def on_ready():
     print(f"{bot.user} ログイン完了。稼働中。")
 
-    # VOICEVOXサーバー
+    # VOICEVOXサーバー（複数起動するときはポートをずらし、CPUのスレッドを分け合う）
     if VOICEVOX_PATH and os.path.exists(VOICEVOX_PATH):
-        try:
-            subprocess.Popen(VOICEVOX_PATH)
-            print(f"✅ VOICEVOXサーバー起動: {VOICEVOX_PATH}")
-        except Exception as e:
-            print(f"⚠️ VOICEVOXサーバー起動失敗: {e}")
+        engine_count = config.VOICEVOX_ENGINE_COUNT
+        threads = max(1, (os.cpu_count() or 1) // engine_count)
+        for i in range(engine_count):
+            port = config.VOICEVOX_BASE_PORT + i
+            args = [VOICEVOX_PATH, "--port", str(port)]
+            if engine_count > 1:
+                args += ["--cpu_num_threads", str(threads)]
+            try:
+                subprocess.Popen(args)
+                print(f"✅ VOICEVOXサーバー起動: {VOICEVOX_PATH}（ポート{port}）")
+            except Exception as e:
+                print(f"⚠️ VOICEVOXサーバー起動失敗（ポート{port}）: {e}")
     else:
         print("⚠️ VOICEVOX_PATHが設定されていないか、ファイルが存在しません")
 
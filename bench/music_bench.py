@@ -0,0 +1,476 @@
+"""
+Music Cog のオフラインベンチマーク。
+
+Discord・YouTubeには接続せず、偽のVoiceClient・スタブ抽出器・合成インタラクションで
+N ギルド分の /music → 再生 → 曲間の遷移 → ボタン操作 を動かし、次を計測する。
+
+- 曲間の無音時間（前の曲の最終フレームから次の曲の最初のフレームまで）のパーセンタイル
+- 送出フレーム数/秒と、20ms周期に間に合わなかったフレームの割合
+- ストリームあたりのCPU使用率（ffmpeg子プロセス分を含む。Windowsでは子プロセス分は0になる）
+- イベントループの遅延
+
+使い方（リポジトリのルートで）:
+    python bench/music_bench.py --guilds 8 --tracks 5 --track-seconds 3
+    python bench/music_bench.py --guilds 4 --audio sample.opus --ffmpeg /usr/bin/ffmpeg
+
+--audio を省略するとffmpegの代わりに無音フレームを返す音源で動かす（Cog側の処理だけを計る）。
+キャッシュ類は一時ディレクトリに作るので memory/ や music/ は汚さない。
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import discord
+import config
+import cogs.music as music
+from cogs.voice_state import VoiceStateIndex
+
+FRAME_SECONDS = 0.02
+PCM_FRAME_BYTES = 3840  # 48kHz・ステレオ・16bitの20ms分
+BENCH_URL = "https://www.youtube.com/watch?v={}"
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def bench_video_id(guild_index, track_index):
+    # YouTubeの動画IDと同じ11文字にして extract_video_id・各キャッシュを通常どおり通す
+    return f"b{guild_index:04d}t{track_index:05d}"[:11].ljust(11, "0")
+
+class Stats:
+    """
+    全ギルド分の計測値（音声スレッドからも書き込む）
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.gaps = []  # 秒
+        self.frames = 0
+        self.late_frames = 0
+        self.loop_lags = []  # 秒
+        self.tracks_started = 0
+        self.play_seconds = 0.0  # 全ストリームの再生スレッドが動いていた時間の合計
+
+    def add_frame(self, late):
+        with self.lock:
+            self.frames += 1
+            if late:
+                self.late_frames += 1
+
+    def add_play_time(self, seconds):
+        with self.lock:
+            self.play_seconds += seconds
+
+    def add_gap(self, gap):
+        with self.lock:
+            self.gaps.append(gap)
+            self.tracks_started += 1
+
+class SilentFFmpegAudio(discord.AudioSource):
+    """
+    FFmpegOpusAudio / FFmpegPCMAudio の代わりに、URLの seconds= 分だけ無音フレームを返す音源。
+    before_options の -ss も解釈するので音量変更・シークの差し替え処理もそのまま動く。
+    """
+    def __init__(self, source, *, opus, before_options=None, **kwargs):
+        seconds = float(parse_qs(urlparse(source).query).get("seconds", ["3"])[0])
+        start = 0.0
+        parts = (before_options or "").split()
+        if "-ss" in parts:
+            start = float(parts[parts.index("-ss") + 1])
+        self.remaining = max(0, int((seconds - start) / FRAME_SECONDS))
+        self.opus = opus
+        self.frame = discord.opus.OPUS_SILENCE if opus else b"\x00" * PCM_FRAME_BYTES
+
+    def read(self):
+        if self.remaining <= 0:
+            return b""
+        self.remaining -= 1
+        return self.frame
+
+    def is_opus(self):
+        return self.opus
+
+    def cleanup(self):
+        self.remaining = 0
+
+def silent_opus_audio(source, **kwargs):
+    return SilentFFmpegAudio(source, opus=True, **kwargs)
+
+def silent_pcm_audio(source, **kwargs):
+    return SilentFFmpegAudio(source, opus=False, **kwargs)
+
+class StubExtractor:
+    """
+    ExtractorPool の代わり。yt-dlpを使わず、一定の遅延の後にローカルファイル（または無音音源）を返す
+    """
+    def __init__(self, track_seconds, latency, audio_path=None):
+        self.track_seconds = track_seconds
+        self.latency = latency
+        self.audio_path = audio_path
+        self.calls = 0
+
+    async def extract(self, url, ydl_opts, priority=music.PRIORITY_NOW_PLAYING, timeout=music.EXTRACT_TIMEOUT, **kwargs):
+        self.calls += 1
+        # 実際の抽出と同じくワーカースレッドで待つ
+        await asyncio.to_thread(time.sleep, self.latency)
+        if ydl_opts is music.SEARCH_YDL_OPTS:
+            query = url.split()[-1]
+            return {"entries": [{"id": query[:11].ljust(11, "0")}]}
+        video_id = music.extract_video_id(url) or url[:11]
+        stream_url = self.audio_path or f"bench://{video_id}?seconds={self.track_seconds}"
+        return {
+            "id": video_id,
+            "title": f"Bench {video_id}",
+            "duration": self.track_seconds,
+            "url": stream_url,
+            "format_id": "bench",
+            "acodec": "opus",
+            "ext": "opus",
+        }
+
+    def raise_priority(self, key, priority):
+        # 抽出は待ち行列を持たないので、優先度の変更は何もしない
+        return False
+
+    def shutdown(self):
+        pass
+
+class FakeVoiceClient:
+    """
+    discord.VoiceClient の代わり。AudioPlayer と同じく別スレッドで20msごとに source.read() を呼ぶ
+    """
+    def __init__(self, channel, stats, encoder=None):
+        self.channel = channel
+        self.stats = stats
+        self.encoder = encoder
+        self.source = None
+        self.connected = True
+        self.thread = None
+        self.end = threading.Event()
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.last_frame_at = None
+
+    def is_connected(self):
+        return self.connected
+
+    def is_playing(self):
+        return self.thread is not None and self.thread.is_alive() and self.resumed.is_set() and not self.end.is_set()
+
+    def is_paused(self):
+        return self.thread is not None and self.thread.is_alive() and not self.resumed.is_set()
+
+    def play(self, source, *, after=None):
+        if self.is_playing() or self.is_paused():
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self.end = threading.Event()
+        self.resumed.set()
+        self.thread = threading.Thread(target=self._run, args=(source, self.end, after), daemon=True)
+        self.thread.start()
+
+    def _run(self, source, end, after):
+        error = None
+        first = True
+        start = began = time.perf_counter()
+        loops = 0
+        try:
+            while not end.is_set():
+                if not self.resumed.is_set():
+                    self.resumed.wait()
+                    start = time.perf_counter()
+                    loops = 0
+                    continue
+                data = source.read()
+                if not data:
+                    break
+                if self.encoder is not None and not source.is_opus():
+                    self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME)
+                now = time.perf_counter()
+                if first:
+                    first = False
+                    if self.last_frame_at is not None:
+                        self.stats.add_gap(now - self.last_frame_at)
+                late = loops > 0 and now - (start + FRAME_SECONDS * loops) > FRAME_SECONDS
+                self.stats.add_frame(late)
+                self.last_frame_at = now
+                loops += 1
+                time.sleep(max(0.0, start + FRAME_SECONDS * loops - time.perf_counter()))
+        except Exception as e:
+            error = e
+        finally:
+            # AudioPlayer と同じく、after を呼ぶ前に再生終了扱いにする
+            end.set()
+            self.stats.add_play_time(time.perf_counter() - began)
+            source.cleanup()
+            if after is not None:
+                after(error)
+
+    def pause(self):
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
+
+    def stop(self):
+        self.end.set()
+        self.resumed.set()
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+        self.connected = False
+        self.channel.guild.voice_client = None
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+class FakeMessage:
+    def __init__(self, channel, content=None):
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, **kwargs):
+        self.content = kwargs.get("content", self.content)
+
+    async def delete(self):
+        pass
+
+class FakeTextChannel:
+    def __init__(self, guild):
+        self.guild = guild
+        self.id = guild.id * 10 + 1
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        return FakeMessage(self, content)
+
+class FakeVoiceChannel:
+    def __init__(self, guild, stats, encoder):
+        self.guild = guild
+        self.id = guild.id * 10 + 2
+        self.stats = stats
+        self.encoder = encoder
+
+    async def connect(self, **kwargs):
+        vc = FakeVoiceClient(self, self.stats, self.encoder)
+        self.guild.voice_client = vc
+        return vc
+
+class FakeGuild:
+    def __init__(self, guild_id, stats, encoder):
+        self.id = guild_id
+        self.voice_client = None
+        self.text_channel = FakeTextChannel(self)
+        self.voice_channel = FakeVoiceChannel(self, stats, encoder)
+
+    def get_channel(self, channel_id):
+        for channel in (self.text_channel, self.voice_channel):
+            if channel.id == channel_id:
+                return channel
+        return None
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+        self.voice = None
+        self.mention = f"<@{user_id}>"
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def send_message(self, *args, **kwargs):
+        self.done = True
+
+class FakeFollowup:
+    async def send(self, content=None, **kwargs):
+        return FakeMessage(None, content)
+
+class FakeInteraction:
+    def __init__(self, guild, user):
+        self.guild = guild
+        self.user = user
+        self.channel = guild.text_channel
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+    async def edit_original_response(self, **kwargs):
+        pass
+
+class FakeBot:
+    def __init__(self, loop):
+        self.loop = loop
+        self.user = None
+        self.current_running_cog = None
+        self.cogs = {}
+
+    def is_ready(self):
+        return False
+
+    async def wait_until_ready(self):
+        pass
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
+
+async def measure_loop_lag(stats, stop, interval=0.01):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stats.loop_lags.append(time.perf_counter() - started - interval)
+
+async def press_buttons(cog, guild, user, interval, stop):
+    """
+    再生中にボタン操作（音量・キュー表示・一時停止）を一定間隔で送る
+    """
+    rng = random.Random(guild.id)
+    buttons = ["volume_up", "volume_down", "show_queue", "toggle_pause"]
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        if guild.id not in cog.players:
+            return
+        view = cog.PlayerControls(guild.text_channel, cog)
+        name = rng.choice(buttons)
+        await getattr(view, name).callback(FakeInteraction(guild, user))
+        if name == "toggle_pause":
+            # 一時停止したままにはしない
+            await asyncio.sleep(0.1)
+            await view.toggle_pause.callback(FakeInteraction(guild, user))
+        view.stop()
+
+async def run_guild(cog, guild, user, tracks, guild_index, keyword_ratio):
+    rng = random.Random(guild_index)
+    for track_index in range(tracks):
+        video_id = bench_video_id(guild_index, track_index)
+        # 一部はキーワード検索経由で積む（検索キャッシュの経路も通す）
+        query = f"bench {video_id}" if rng.random() < keyword_ratio else BENCH_URL.format(video_id)
+        await cog.music_command.callback(cog, FakeInteraction(guild, user), query)
+
+async def main(args):
+    stats = Stats()
+    loop = asyncio.get_running_loop()
+
+    encoder = None
+    if args.pcm:
+        music.OPUS_OUTPUT = False
+        try:
+            if not discord.opus.is_loaded():
+                discord.opus._load_default()
+            encoder = discord.opus.Encoder()
+        except Exception as e:
+            print(f"Opusライブラリが読み込めないのでPCMのエンコード負荷は計測しません: {e}")
+
+    audio_path = None
+    if args.audio:
+        audio_path = os.path.abspath(args.audio)
+        if args.ffmpeg:
+            config.FFMPEG_PATH = args.ffmpeg
+    else:
+        discord.FFmpegOpusAudio = silent_opus_audio
+        discord.FFmpegPCMAudio = silent_pcm_audio
+
+    bot = FakeBot(loop)
+    index = VoiceStateIndex(bot)
+    bot.cogs["VoiceStateIndex"] = index
+    cog = music.Music(bot)
+    cog.extractor.shutdown()
+    cog.extractor = StubExtractor(args.track_seconds, args.extract_latency, audio_path)
+    bot.cogs["Music"] = cog
+
+    guilds = []
+    for i in range(args.guilds):
+        guild = FakeGuild(1000 + i, stats, encoder)
+        user = FakeUser(5000 + i)
+        index._move(guild.id, user.id, guild.voice_channel.id)
+        guilds.append((guild, user))
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stats, stop))
+    button_tasks = []
+    if args.button_interval > 0:
+        button_tasks = [
+            asyncio.create_task(press_buttons(cog, guild, user, args.button_interval, stop))
+            for guild, user in guilds
+        ]
+
+    cpu_start = os.times()
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(
+        run_guild(cog, guild, user, args.tracks, i, args.keyword_ratio)
+        for i, (guild, user) in enumerate(guilds)
+    ))
+
+    # すべてのギルドのキューが再生し終わってプレイヤーが破棄されるまで待つ
+    deadline = wall_start + args.tracks * args.track_seconds * 3 + 30
+    while cog.players and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    wall = time.perf_counter() - wall_start
+    cpu_end = os.times()
+
+    stop.set()
+    for task in [lag_task, *button_tasks]:
+        task.cancel()
+    await asyncio.gather(lag_task, *button_tasks, return_exceptions=True)
+    if cog.players:
+        print(f"警告: 時間内に終わらなかったギルドがあります（{len(cog.players)}件）")
+        await cog.stop_all()
+    await cog.cog_unload()
+
+    cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    child_cpu = (cpu_end.children_user - cpu_start.children_user) + (cpu_end.children_system - cpu_start.children_system)
+    gaps_ms = [gap * 1000 for gap in stats.gaps]
+    lags_ms = [lag * 1000 for lag in stats.loop_lags]
+    streams = max(1, args.guilds)
+
+    print(f"ギルド数: {args.guilds}  曲数/ギルド: {args.tracks}  曲の長さ: {args.track_seconds}s  "
+          f"音源: {'ffmpeg ' + audio_path if audio_path else '無音（ffmpegなし）'}  出力: {'PCM' if args.pcm else 'Opus'}")
+    print(f"経過時間: {wall:.2f}s  抽出呼び出し: {cog.extractor.calls}回")
+    print(f"曲間の無音 (ms, n={len(gaps_ms)}, 途切れなしなら{FRAME_SECONDS * 1000:.0f}): "
+          f"p50={percentile(gaps_ms, 50):.1f} p90={percentile(gaps_ms, 90):.1f} "
+          f"p99={percentile(gaps_ms, 99):.1f} max={max(gaps_ms, default=0):.1f}")
+    print(f"フレーム: {stats.frames}  {stats.frames / wall:.1f}フレーム/s "
+          f"(再生中 {stats.frames / max(stats.play_seconds, 1e-9):.1f}/s/ストリーム, 目標{1 / FRAME_SECONDS:.0f})  "
+          f"遅延フレーム: {stats.late_frames} ({stats.late_frames / max(1, stats.frames):.2%})")
+    print(f"CPU: Bot {cpu / wall / streams:.2%}/ストリーム  ffmpeg {child_cpu / wall / streams:.2%}/ストリーム")
+    print(f"イベントループ遅延 (ms): p50={percentile(lags_ms, 50):.2f} p99={percentile(lags_ms, 99):.2f} "
+          f"max={max(lags_ms, default=0):.2f}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Music Cog のオフラインベンチマーク")
+    parser.add_argument("--guilds", type=int, default=4, help="同時に再生するギルド数")
+    parser.add_argument("--tracks", type=int, default=5, help="ギルドごとにキューに積む曲数")
+    parser.add_argument("--track-seconds", type=float, default=3.0, help="1曲の長さ（無音音源のとき）")
+    parser.add_argument("--extract-latency", type=float, default=0.3, help="スタブ抽出器の応答時間（秒）")
+    parser.add_argument("--keyword-ratio", type=float, default=0.3, help="キーワード検索で積む割合")
+    parser.add_argument("--button-interval", type=float, default=1.0, help="ボタン操作の間隔（秒、0で無効）")
+    parser.add_argument("--audio", help="再生に使うローカル音声ファイル（指定すると実際にffmpegを起動する）")
+    parser.add_argument("--ffmpeg", help="ffmpegの実行ファイル（省略時は config.FFMPEG_PATH）")
+    parser.add_argument("--pcm", action="store_true", help="Opus出力ではなくPCM出力（OPUS_OUTPUT=False）で計測")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    with tempfile.TemporaryDirectory(prefix="music_bench_") as workdir:
+        # 検索・音声キャッシュなどは相対パスなので一時ディレクトリに書かせる
+        os.chdir(workdir)
+        os.makedirs(config.MEMORY_DIR, exist_ok=True)
+        asyncio.run(main(arguments))
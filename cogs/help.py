@@ -13,11 +13,14 @@ class Help(commands.Cog):
             "🎉 コマンド名をクリックすると入力欄に自動で挿入されます！\n"
             "🔮 [/fortune](</fortune>) - 占い機能。今日の運勢を占えます。\n"
             "🎵 [/music](</music>) - 音楽再生機能。YouTubeやApple Music対応、ボタンで操作も可能！\n"
+            "📜 [/music_remove](</music_remove>) / [/music_playnext](</music_playnext>) - キューの曲を#番号で削除・次に再生。\n"
+            "⏩ [/seek](</seek>) - 再生中の曲の再生位置を移動（例: 1:30）。\n"
             "🕹️ [/game](</game>) - ゲーム募集機能。ゲームの募集を作成し、参加・辞退・キャンセルができます。\n"
             "♻️ [/reload](</reload>) - Botの再起動（開発者専用）。Botを再起動し、最新状態に更新します。\n"
             "📊 [/status](</status>) - Botの状態表示。稼働時間、CPU・メモリ使用率、PINGを確認できます。\n"
             "🧹 [/clear](</clear>) - メッセージ一括削除。チャンネルのメッセージをまとめて削除します。\n"
             "🗣️ [/join](</join>) / [/leave](</leave>) / [/voice_settings](</voice_settings>) - VC参加・退出・話者/音量設定。\n"
+            "📖 [/dict_add](</dict_add>) / [/dict_remove](</dict_remove>) / [/dict_list](</dict_list>) - 読み上げ辞書の登録・削除・一覧（サーバーごと）。\n"
             "📌 [/keep](</keep>) / [/keep_cancel](</keep_cancel>) - チャンネルの最新メッセージ固定・解除。\n"
             "🛌 [/afk](</afk>) / [/back](</back>) - AFK（離席中）状態の設定・解除。\n"
             "質問や要望はいつでもどうぞ！"
@@ -9,10 +9,74 @@ import aiohttp
 import re
 import mimetypes
 import config
+import time
+import contextlib
+import struct
+import hashlib
+import heapq
+import itertools
+import threading
+import zipfile
+import io
+import unicodedata
+import numpy as np
+from collections import deque, OrderedDict
+from cogs.voice_state import find_user_voice_channel
 
-VOICEVOX_PATH = config.VOICEVOX_PATH
-FFMPEG_PATH = config.FFMPEG_PATH
-VOICEVOX_PORT = 50021
+VOICEVOX_ENDPOINTS = config.VOICEVOX_ENDPOINTS
+VOICEVOX_CONNECTION_LIMIT = 8  # エンジン1つあたりの同時接続数の上限
+VOICEVOX_KEEPALIVE_TIMEOUT = 60  # 秒。使っていない接続を保持する時間
+VOICEVOX_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=3)
+VOICEVOX_RETRIES = 2  # 接続エラー・5xxのときに再試行する回数
+VOICEVOX_RETRY_BACKOFF = 0.2  # 秒。再試行ごとに倍にする
+VOICEVOX_LATENCY_SAMPLES = 200  # エンドポイントごとに保持する直近の所要時間の数
+VOICEVOX_HEALTH_INTERVAL = 10  # 秒。/version で各エンジンの死活を確認する間隔
+VOICEVOX_HEALTH_TIMEOUT = aiohttp.ClientTimeout(total=2)
+VOICEVOX_HEALTH_STARTUP_DELAY = 5  # 秒。起動直後はエンジンの立ち上がりを待ってから死活確認を始める
+VOICEVOX_EJECT_FAILURES = 3  # 続けてこの回数失敗したエンジンは死活確認が通るまで外す
+
+TTS_LOOKAHEAD = 3  # 再生中の文の後ろに先に合成しておく文の数（ギルドごと）
+TTS_PIPELINE_CONCURRENCY = 2  # 1ギルドで同時に合成する文の数（1ギルドがエンジンを占有しないように）
+TTS_SYNTHESIS_PER_ENGINE = 6  # エンジン1台に同時に投げる合成の数（CPUのコア数程度）
+TTS_SYNTHESIS_CONCURRENCY = TTS_SYNTHESIS_PER_ENGINE * len(VOICEVOX_ENDPOINTS)  # 全ギルド合計でVOICEVOXに同時に投げる合成の数
+PRIORITY_FIRST_CHUNK = 0  # 文の最初の塊（これが鳴るまで無音になる）
+PRIORITY_NEXT_CHUNK = 10  # 再生中に間に合えばよい後続の塊
+
+TTS_CHUNK_MIN_TEXT = 20  # これ以下の文は分割しない。後続の塊もこの長さまではまとめる
+TTS_FIRST_CHUNK_MIN_TEXT = 4  # 最初の塊の最小の長さ（「あ、」だけで区切らない）
+TTS_CHUNK_MAX_TEXT = 80  # 1つの塊の最大の長さ
+TTS_CLAUSE_PATTERN = re.compile(r"[^。！？!?、，,\n]*[。！？!?、，,\n]+|[^。！？!?、，,\n]+")
+TTS_SENTENCE_ENDS = "。！？!?\n"
+
+TTS_MAX_TEXT = 100  # 読み上げる最大文字数。超えた分は省略する
+TTS_OMITTED_SUFFIX = "、以下省略"
+TTS_REPEAT_MAX = 3  # 同じ文字の連続はここまでに縮める（「ーーーーー」「！！！！」など）
+TTS_REPEAT_CHARS = "wWー~〜!?。、・.…草ッっ"  # 縮める対象（笑い・長音・記号。数字は縮めない）
+# 読み上げ前に置き換える記法（1回の走査でまとめて処理する）
+TTS_MESSAGE_PATTERN = re.compile(
+    r"(?P<code>```.*?```)"
+    r"|(?P<spoiler>\|\|.+?\|\|)"
+    r"|(?P<url>https?://\S+)"
+    r"|<a?:(?P<emoji>\w+):\d+>"
+    r"|<@!?(?P<user>\d+)>"
+    r"|<@&(?P<role>\d+)>"
+    r"|<#(?P<channel>\d+)>"
+    rf"|(?P<repeat>(?P<char>[{re.escape(TTS_REPEAT_CHARS)}])(?P=char){{{TTS_REPEAT_MAX},}})",
+    re.DOTALL,
+)
+TTS_SPACES_PATTERN = re.compile(r"[ \t\u3000]+")
+
+TTS_MERGE_ENABLED = True  # 同じ話者の短文が続いたら multi_synthesis でまとめて合成する
+TTS_MERGE_WINDOW = 0.3  # 秒。再生中に続きの短文が届くのを待つ時間（止まっているときはまとめない）
+TTS_MERGE_MAX_MESSAGES = 6  # 1回にまとめる最大件数
+TTS_MERGE_MAX_TEXT = 120  # まとめる文の合計文字数の上限
+
+TTS_CACHE_DIR = config.TTS_CACHE_DIR
+TTS_CACHE_MAX_TEXT = 40  # これより長い文は繰り返されにくいのでキャッシュしない
+TTS_CACHE_MEMORY_BYTES = 64 * 1024 * 1024  # メモリに置くPCMの合計上限（約5分半）
+TTS_CACHE_DISK_ENABLED = True
+TTS_CACHE_DISK_BYTES = 200 * 1024 * 1024  # ディスクに置くWAVの合計上限
+TTS_CACHE_DISK_MIN_HITS = 2  # この回数使われた音声だけディスクに保存する
 SETTINGS_FILE = config.SETTINGS_PATH
 
 def load_settings():
@@ -42,6 +106,548 @@ with open("memory/SPEAKER_DATA.json", "r", encoding="utf-8") as f:
         for item in raw_data
     }
 
+DISCORD_SAMPLE_RATE = 48000
+DISCORD_CHANNELS = 2
+PCM_FRAME_BYTES = 3840  # 20ms分（48kHz・ステレオ・16bit）
+
+def parse_wav(data: bytes):
+    """
+    RIFF/WAVEを解析して (サンプリングレート, int16の配列[サンプル数, チャンネル数]) を返す。
+    VOICEVOXが返す16bitリニアPCMのみ対応
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("WAVではありません")
+    fmt = None
+    pcm = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        size = int.from_bytes(data[pos + 4:pos + 8], "little")
+        body = data[pos + 8:pos + 8 + size]
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", body[:16])
+        elif chunk_id == b"data":
+            pcm = body
+        # チャンクは2バイト境界に揃えられている
+        pos += 8 + size + (size & 1)
+    if fmt is None or pcm is None:
+        raise ValueError("fmt/dataチャンクがありません")
+    audio_format, channels, sample_rate, _, _, bits = fmt
+    if audio_format not in (1, 0xFFFE) or bits != 16 or channels < 1:
+        raise ValueError(f"未対応のWAV形式です（format={audio_format}, bits={bits}）")
+    frame_size = 2 * channels
+    samples = np.frombuffer(pcm[:len(pcm) // frame_size * frame_size], dtype="<i2")
+    return sample_rate, samples.reshape(-1, channels)
+
+def to_discord_pcm(sample_rate, samples) -> bytes:
+    """
+    PCMを48kHz・ステレオ・16bit（discord.pyがそのままOpusにできる形式）に変換する
+    """
+    # モノラル（VOICEVOXは既定でモノラル）は1チャンネルだけ補間してから複製する
+    channels = samples[:, :1] if samples.shape[1] == 1 else samples[:, :DISCORD_CHANNELS]
+    if sample_rate != DISCORD_SAMPLE_RATE and len(channels):
+        count = int(round(len(channels) * DISCORD_SAMPLE_RATE / sample_rate))
+        positions = np.arange(count) * (sample_rate / DISCORD_SAMPLE_RATE)
+        source_positions = np.arange(len(channels))
+        channels = np.stack(
+            [np.interp(positions, source_positions, channels[:, c]) for c in range(channels.shape[1])],
+            axis=1,
+        )
+    if channels.shape[1] == 1:
+        channels = np.repeat(channels, DISCORD_CHANNELS, axis=1)
+    return np.clip(np.rint(channels), -32768, 32767).astype("<i2").tobytes()
+
+def wav_to_discord_pcm(data: bytes) -> bytes:
+    sample_rate, samples = parse_wav(data)
+    return to_discord_pcm(sample_rate, samples)
+
+class PCMBufferSource(discord.AudioSource):
+    """
+    メモリ上の48kHz・ステレオPCMを20msずつ返す音源（一時ファイル・ffmpegを使わない）。
+    feed() で後からPCMを継ぎ足せる。close() されるまでは、続きが届いていなければ無音を返して待つ
+    """
+    def __init__(self, pcm: bytes = b"", closed=True):
+        self.buffer = bytearray(pcm)
+        self.offset = 0
+        self.closed = closed
+        self.lock = threading.Lock()
+
+    def feed(self, pcm: bytes):
+        with self.lock:
+            # 読み終わった分は捨てて継ぎ足す（塊の境目でフレームを区切らないので隙間ができない）
+            del self.buffer[:self.offset]
+            self.offset = 0
+            self.buffer += pcm
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+
+    def read(self):
+        with self.lock:
+            frame = bytes(self.buffer[self.offset:self.offset + PCM_FRAME_BYTES])
+            if len(frame) == PCM_FRAME_BYTES or (self.closed and frame):
+                self.offset += len(frame)
+            elif not self.closed:
+                # 続きの合成待ち（途中まで届いた分は次の feed 後にまとめて返す）
+                return b"\x00" * PCM_FRAME_BYTES
+        if not frame:
+            return b""
+        if len(frame) < PCM_FRAME_BYTES:
+            # 最後の半端なフレームは無音で埋める
+            return frame + b"\x00" * (PCM_FRAME_BYTES - len(frame))
+        return frame
+
+    def is_opus(self):
+        return False
+
+def split_tts_chunks(text: str):
+    """
+    読み上げ文を句読点・改行で区切った塊のリストにする。
+    最初の塊は最初の節だけにしてすぐ鳴らし、以降は文末まで（長すぎれば節の切れ目で）まとめる
+    """
+    text = text.strip()
+    if len(text) <= TTS_CHUNK_MIN_TEXT:
+        return [text] if text else []
+    clauses = []
+    for clause in TTS_CLAUSE_PATTERN.findall(text):
+        while len(clause) > TTS_CHUNK_MAX_TEXT:
+            clauses.append(clause[:TTS_CHUNK_MAX_TEXT])
+            clause = clause[TTS_CHUNK_MAX_TEXT:]
+        clauses.append(clause)
+
+    chunks = []
+    current = ""
+    for clause in clauses:
+        if current and len(current) + len(clause) > TTS_CHUNK_MAX_TEXT:
+            chunks.append(current)
+            current = ""
+        current += clause
+        if not chunks:
+            if len(current.strip()) >= TTS_FIRST_CHUNK_MIN_TEXT:
+                chunks.append(current)
+                current = ""
+        elif len(current.strip()) >= TTS_CHUNK_MIN_TEXT and current[-1] in TTS_SENTENCE_ENDS:
+            chunks.append(current)
+            current = ""
+    if current.strip():
+        if chunks and len(current.strip()) < TTS_FIRST_CHUNK_MIN_TEXT:
+            chunks[-1] += current
+        else:
+            chunks.append(current)
+
+    # 記号だけの塊は読むものが無いので合成しない
+    chunks = [chunk.strip() for chunk in chunks if any(ch.isalnum() for ch in chunk)]
+    return chunks or [text]
+
+class SynthesisSlots:
+    """
+    VOICEVOXへの同時合成数を制限するセマフォ。空きを待つ合成は priority の小さい順に通す
+    """
+    def __init__(self, value):
+        self.value = value
+        self.waiters = []  # (priority, 通し番号, future) のヒープ
+        self.counter = itertools.count()
+
+    async def acquire(self, priority):
+        if self.value > 0 and not self.waiters:
+            self.value -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 枠を受け取った直後にキャンセルされたら次に回す
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, _, fut = heapq.heappop(self.waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.value += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+class Utterance:
+    """
+    1つのメッセージの読み上げ。塊ごとの合成タスクを読む順に持つ
+    """
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def cancel(self):
+        for job in self.jobs:
+            job.cancel()
+
+def describe_attachment(filename):
+    mime, _ = mimetypes.guess_type(filename)
+    if mime:
+        if mime.startswith("image/"):
+            return "画像"
+        if mime.startswith("video/"):
+            return "動画"
+        if mime.startswith("audio/"):
+            return "音声ファイル"
+    return "ファイル"
+
+def normalize_message(bot, message) -> str:
+    """
+    メッセージを読み上げる文にする。
+    URL・メンション・絵文字などの記法を読める言葉に置き換え、サーバーの読み上げ辞書を当て、長すぎる分は省略する
+    """
+    guild = message.guild
+
+    def replace_token(m):
+        kind = m.lastgroup
+        if kind == "code":
+            return " コード省略 "
+        if kind == "spoiler":
+            return " ネタバレ "
+        if kind == "url":
+            return " ユーアールエル "
+        if kind == "emoji":
+            return m.group("emoji").replace("_", " ")
+        if kind == "user":
+            member = guild.get_member(int(m.group("user"))) if guild else None
+            return member.display_name if member else "メンション"
+        if kind == "role":
+            role = guild.get_role(int(m.group("role"))) if guild else None
+            return role.name if role else "ロール"
+        if kind == "channel":
+            channel = guild.get_channel(int(m.group("channel"))) if guild else None
+            return channel.name if channel else "チャンネル"
+        return m.group("char") * TTS_REPEAT_MAX
+
+    text = TTS_MESSAGE_PATTERN.sub(replace_token, unicodedata.normalize("NFKC", message.content))
+    dictionary = bot.get_cog("ReadingDictionary")
+    if dictionary and guild:
+        text = dictionary.apply(guild.id, text)
+    text = TTS_SPACES_PATTERN.sub(" ", text).strip()
+    if len(text) > TTS_MAX_TEXT:
+        text = text[:TTS_MAX_TEXT] + TTS_OMITTED_SUFFIX
+
+    notices = [f"{kind}が送信されました" for kind in dict.fromkeys(
+        describe_attachment(attachment.filename) for attachment in message.attachments
+    )]
+    if message.stickers:
+        notices.append("スタンプが送信されました")
+    return " ".join([text] + notices).strip()
+
+def normalize_tts_text(text: str) -> str:
+    """
+    全角/半角・空白の違いを吸収した合成キャッシュのキー
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+class SynthesisCache:
+    """
+    (正規化した文, style_id, 音量) → 合成音声 の2段キャッシュ。
+    メモリには再生できる48kHzのPCMをLRUで持ち、繰り返し使われた音声は元のWAVを
+    memory/tts_cache/ にも保存して再起動後も使う（ディスク側も古い順に消す）。
+    """
+    def __init__(self, directory=TTS_CACHE_DIR, memory_bytes=TTS_CACHE_MEMORY_BYTES,
+                 disk_bytes=TTS_CACHE_DISK_BYTES, disk_enabled=TTS_CACHE_DISK_ENABLED):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.disk_enabled = disk_enabled
+        self.entries = OrderedDict()  # key: {"pcm", "wav", "hits"}
+        self.memory_used = 0
+        self.files = OrderedDict()  # ファイル名: サイズ（古い順）
+        self.disk_used = 0
+        self.hits = 0
+        self.misses = 0
+        if self.disk_enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            self.scan()
+
+    @staticmethod
+    def make_key(text, style_id, volume):
+        if len(text) > TTS_CACHE_MAX_TEXT:
+            return None
+        return (normalize_tts_text(text), int(style_id), round(float(volume), 2))
+
+    @staticmethod
+    def filename(key):
+        return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest() + ".wav"
+
+    def scan(self):
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".wav"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(found):
+            self.files[name] = size
+            self.disk_used += size
+
+    async def get(self, key):
+        """
+        キャッシュ済みのPCMを返す。メモリに無ければディスクから読んでメモリに載せる
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            entry["hits"] += 1
+            self.hits += 1
+            if entry["hits"] >= TTS_CACHE_DISK_MIN_HITS:
+                await self.persist(key, entry)
+            return entry["pcm"]
+        if self.disk_enabled:
+            name = self.filename(key)
+            if name in self.files:
+                try:
+                    wav, pcm = await asyncio.to_thread(self._load, name)
+                except Exception as e:
+                    print(f"[SynthesisCache] 読み込みエラー: {e}")
+                    self._drop_file(name)
+                else:
+                    self.files.move_to_end(name)
+                    self._remember(key, pcm, wav, hits=TTS_CACHE_DISK_MIN_HITS)
+                    self.hits += 1
+                    return pcm
+        self.misses += 1
+        return None
+
+    def _load(self, name):
+        path = os.path.join(self.directory, name)
+        with open(path, "rb") as f:
+            wav = f.read()
+        # 最後に使われた時刻として更新日時を残す
+        os.utime(path)
+        return wav, wav_to_discord_pcm(wav)
+
+    def put(self, key, wav, pcm):
+        self._remember(key, pcm, wav, hits=1)
+
+    def _remember(self, key, pcm, wav, hits):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.memory_used -= len(old["pcm"])
+        self.entries[key] = {"pcm": pcm, "wav": wav, "hits": hits}
+        self.memory_used += len(pcm)
+        while self.memory_used > self.memory_bytes and self.entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.memory_used -= len(evicted["pcm"])
+
+    async def persist(self, key, entry):
+        if not self.disk_enabled:
+            return
+        name = self.filename(key)
+        if name in self.files:
+            return
+        try:
+            await asyncio.to_thread(self._write, name, entry["wav"])
+        except Exception as e:
+            print(f"[SynthesisCache] 保存エラー: {e}")
+            return
+        self.files[name] = len(entry["wav"])
+        self.disk_used += len(entry["wav"])
+        while self.disk_used > self.disk_bytes and self.files:
+            self._drop_file(next(iter(self.files)))
+
+    def _write(self, name, wav):
+        path = os.path.join(self.directory, name)
+        partial = path + ".part"
+        with open(partial, "wb") as f:
+            f.write(wav)
+        os.replace(partial, path)
+
+    def _drop_file(self, name):
+        size = self.files.pop(name, 0)
+        self.disk_used -= size
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[SynthesisCache] 削除エラー: {e}")
+
+class VoicevoxError(Exception):
+    pass
+
+class EndpointStats:
+    """
+    VOICEVOXのエンドポイントごとの呼び出し回数・失敗数・直近の所要時間
+    """
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=VOICEVOX_LATENCY_SAMPLES)  # 秒
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p95_ms": round(self.percentile(95) * 1000, 1),
+        }
+
+class VoicevoxEngine:
+    """
+    プール内のエンジン1つ。処理中のリクエスト数・死活・エンドポイントごとの統計を持つ
+    """
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0  # 続けて失敗した回数
+        self.stats = {}  # path: EndpointStats
+
+    def record_failure(self):
+        self.failures += 1
+        if self.healthy and self.failures >= VOICEVOX_EJECT_FAILURES:
+            self.healthy = False
+            print(f"⚠️ VOICEVOXエンジンを切り離しました: {self.base_url}")
+
+    def record_success(self):
+        self.failures = 0
+
+    def summary(self):
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "paths": {path: stats.summary() for path, stats in self.stats.items()},
+        }
+
+class VoicevoxClient:
+    """
+    Cogが持ち続けるVOICEVOXエンジン群のHTTPクライアント。
+    セッションとkeep-alive接続を使い回し、リクエストは処理中の数が最も少ない正常なエンジンに送る。
+    接続エラー・5xxは別のエンジンで間隔を倍にしながら再試行し、続けて失敗したエンジンは
+    probe() の死活確認が通るまで外す。
+    """
+    def __init__(self, endpoints=VOICEVOX_ENDPOINTS, limit=VOICEVOX_CONNECTION_LIMIT, timeout=VOICEVOX_TIMEOUT,
+                 retries=VOICEVOX_RETRIES, backoff=VOICEVOX_RETRY_BACKOFF):
+        self.engines = [VoicevoxEngine(url.rstrip("/")) for url in endpoints]
+        self.limit = limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit * len(self.engines),
+                limit_per_host=self.limit,
+                keepalive_timeout=VOICEVOX_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def pick(self, tried=()):
+        """
+        処理中のリクエストが最も少ない正常なエンジンを選ぶ。この要求で失敗したエンジンは後回しにする
+        """
+        candidates = [engine for engine in self.engines if engine.healthy] or self.engines
+        fresh = [engine for engine in candidates if engine not in tried]
+        return min(fresh or candidates, key=lambda engine: engine.outstanding)
+
+    async def request(self, method, path, *, params=None, json=None, response="json"):
+        session = await self.get_session()
+        delay = self.backoff
+        tried = []
+        for attempt in range(self.retries + 1):
+            engine = self.pick(tried)
+            tried.append(engine)
+            stats = engine.stats.setdefault(path, EndpointStats())
+            engine.outstanding += 1
+            started = time.perf_counter()
+            try:
+                async with session.request(method, engine.base_url + path, params=params, json=json) as resp:
+                    resp.raise_for_status()
+                    result = await resp.json() if response == "json" else await resp.read()
+                stats.count += 1
+                stats.latencies.append(time.perf_counter() - started)
+                engine.record_success()
+                return result
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                error = e
+                engine.record_failure()
+            except aiohttp.ClientResponseError as e:
+                error = e
+                if e.status < 500:
+                    # 4xx は何度送っても同じなので再試行しない
+                    stats.errors += 1
+                    break
+                engine.record_failure()
+            finally:
+                engine.outstanding -= 1
+            stats.errors += 1
+            if attempt < self.retries:
+                stats.retries += 1
+                await asyncio.sleep(delay)
+                delay *= 2
+        raise VoicevoxError(f"{path}: {error!r}")
+
+    async def probe(self):
+        """
+        全エンジンの /version を確認し、応答したエンジンを戻し、応答しないエンジンを外す
+        """
+        session = await self.get_session()
+
+        async def check(engine):
+            try:
+                async with session.get(engine.base_url + "/version", timeout=VOICEVOX_HEALTH_TIMEOUT) as resp:
+                    resp.raise_for_status()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if engine.healthy:
+                    print(f"⚠️ VOICEVOXエンジンが応答しません: {engine.base_url}")
+                engine.healthy = False
+            else:
+                if not engine.healthy:
+                    print(f"✅ VOICEVOXエンジンが復帰しました: {engine.base_url}")
+                engine.healthy = True
+                engine.failures = 0
+
+        await asyncio.gather(*(check(engine) for engine in self.engines))
+
+    async def audio_query(self, text, style_id):
+        return await self.request("POST", "/audio_query", params={"text": text, "speaker": style_id})
+
+    async def synthesis(self, query, style_id):
+        return await self.request("POST", "/synthesis", params={"speaker": style_id}, json=query, response="bytes")
+
+    async def multi_synthesis(self, queries, style_id):
+        """
+        複数のクエリを1回のリクエストで合成し、WAVのリストを同じ順で返す
+        """
+        data = await self.request("POST", "/multi_synthesis", params={"speaker": style_id}, json=queries, response="bytes")
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            wavs = [archive.read(name) for name in sorted(archive.namelist())]
+        if len(wavs) != len(queries):
+            raise VoicevoxError(f"/multi_synthesis: {len(queries)}件に対して{len(wavs)}件が返りました")
+        return wavs
+
+    def metrics(self):
+        return {engine.base_url: engine.summary() for engine in self.engines}
+
 class StyleSelect(discord.ui.Select):
     def __init__(self, speaker_name):
         options = [
@@ -164,8 +770,7 @@ class VoiceSettingsView(discord.ui.View):
         try:
             if self.parent_cog and interaction.guild.voice_client:
                 await interaction.guild.voice_client.disconnect()
-                self.parent_cog.tts_task = None
-                self.parent_cog.bot.current_running_cog = None
+                await self.parent_cog.close_pipeline(interaction.guild.id)
                 if self.message:
                     try:
                         await self.message.delete()
@@ -194,21 +799,94 @@ class VoiceSettingsView(discord.ui.View):
         self.message = new_msg
         await interaction.response.defer()
 
+class TTSPipeline:
+    """
+    ギルドごとの読み上げパイプライン。ほかのギルドの混雑や「ｓ」による中断の影響を受けない。
+    合成タスクが queue から取り出した文を TTS_LOOKAHEAD 件先まで合成し始めて ready に並べ、
+    再生タスクが ready を届いた順に再生する。
+    """
+    def __init__(self, guild):
+        self.guild = guild
+        self.queue = asyncio.Queue()  # (style_id, text) 合成待ち
+        self.ready = asyncio.Queue(maxsize=TTS_LOOKAHEAD)  # 合成中・合成済みの Utterance（到着順）
+        self.synthesis_slots = asyncio.Semaphore(TTS_PIPELINE_CONCURRENCY)
+        self.cancel_event = asyncio.Event()
+        self.task = None  # 再生タスク
+        self.synthesis_task = None
+
+    def cancel(self):
+        for task in (self.task, self.synthesis_task):
+            if task and not task.done() and task is not asyncio.current_task():
+                task.cancel()
+        while not self.ready.empty():
+            self.ready.get_nowait().cancel()
+
 class Join(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.tts_queue = asyncio.Queue()
-        self.tts_task = None
-        self.cancel_event = asyncio.Event()
+        self.pipelines = {}  # guild_id: TTSPipeline
+        self.voicevox = VoicevoxClient()
+        self.synthesis_cache = SynthesisCache()
+        self.synthesis_slots = SynthesisSlots(TTS_SYNTHESIS_CONCURRENCY)
         self.last_message_id = None
         self.panel_info = {}
         self.panel_content = "✅ VCに接続しました。設定はこちら:"
         self.panel_view = None
         self.panel_watcher.start()
+        self.voicevox_health.start()
 
         if not hasattr(self.bot, "current_running_cog"):
             self.bot.current_running_cog = None
 
+    async def cog_unload(self):
+        self.voicevox_health.cancel()
+        for pipeline in self.pipelines.values():
+            pipeline.cancel()
+        self.pipelines.clear()
+        await self.voicevox.close()
+
+    def get_pipeline(self, guild):
+        """
+        ギルドの読み上げパイプラインを返す。無ければ作ってワーカーを起動する
+        """
+        pipeline = self.pipelines.get(guild.id)
+        if pipeline is None:
+            pipeline = TTSPipeline(guild)
+            self.pipelines[guild.id] = pipeline
+        if not pipeline.synthesis_task or pipeline.synthesis_task.done():
+            pipeline.synthesis_task = asyncio.create_task(self.synthesis_worker(pipeline))
+        if not pipeline.task or pipeline.task.done():
+            pipeline.task = asyncio.create_task(self.tts_worker(pipeline))
+        return pipeline
+
+    async def close_pipeline(self, guild_id):
+        """
+        VCから抜けたギルドのパイプラインを破棄する（待ち行列も捨てる）
+        """
+        pipeline = self.pipelines.pop(guild_id, None)
+        if pipeline:
+            pipeline.cancel_event.set()
+            pipeline.cancel()
+            for task in (pipeline.task, pipeline.synthesis_task):
+                if task:
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+        self.release_running_cog()
+
+    def release_running_cog(self):
+        # 他のギルドでまだ読み上げ中なら Join の占有は解除しない
+        if self.pipelines:
+            return
+        if self.bot.current_running_cog == "Join":
+            self.bot.current_running_cog = None
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        if self.bot.user and member.id == self.bot.user.id and before.channel and after.channel is None:
+            await self.close_pipeline(member.guild.id)
+
     async def ensure_no_conflict(self, interaction):
         if self.bot.current_running_cog and self.bot.current_running_cog != "Join":
             await interaction.response.send_message("他の機能（Music）が実行中です。停止してから使ってください。", ephemeral=True)
@@ -238,14 +916,15 @@ class Join(commands.Cog):
         try:
             if not await self.ensure_no_conflict(interaction):
                 return
-            if not interaction.user.voice:
+            voice_channel = find_user_voice_channel(self.bot, interaction.guild, interaction.user)
+            if not voice_channel:
                 await interaction.response.send_message("❌ VCに参加してから実行してください", ephemeral=True)
                 return
             try:
                 if interaction.guild.voice_client:
-                    await interaction.guild.voice_client.move_to(interaction.user.voice.channel)
+                    await interaction.guild.voice_client.move_to(voice_channel)
                 else:
-                    await interaction.user.voice.channel.connect()
+                    await voice_channel.connect()
             except Exception as e:
                 await interaction.response.send_message(f"VC接続エラー: {e}", ephemeral=True)
                 return
@@ -261,8 +940,7 @@ class Join(commands.Cog):
             await self.send_panel(interaction.channel, view)
             await interaction.response.send_message("接続しました。", ephemeral=True)
 
-            if not self.tts_task or self.tts_task.done():
-                self.tts_task = asyncio.create_task(self.tts_worker(interaction.guild))
+            self.get_pipeline(interaction.guild)
         except Exception as e:
             await interaction.response.send_message(f"コマンド実行エラー: {e}", ephemeral=True)
 
@@ -287,10 +965,16 @@ class Join(commands.Cog):
             voice_client = message.guild.voice_client
             if not voice_client or not voice_client.is_connected():
                 return
+            index = self.bot.get_cog("VoiceStateIndex")
+            if index and index.is_empty(message.guild.id, voice_client.channel.id):
+                # 聴いている人がいなければ合成しない
+                return
             if message.content.strip() == "ｓ":
+                pipeline = self.pipelines.get(message.guild.id)
                 if voice_client.is_playing():
                     voice_client.stop()
-                    self.cancel_event.set()
+                    if pipeline:
+                        pipeline.cancel_event.set()
                 return
 
             uid = str(message.author.id)
@@ -302,116 +986,242 @@ class Join(commands.Cog):
                 speaker_name = "四国めたん"
                 style_id = 2
 
-            text = message.content
-            url_pattern = r'https?://[^\s]+'
-            if re.search(url_pattern, text):
-                text = re.sub(url_pattern, 'ユーアールエル', text)
-            if message.attachments:
-                for attachment in message.attachments:
-                    mime, _ = mimetypes.guess_type(attachment.filename)
-                    if mime:
-                        if mime.startswith("image/"):
-                            text += " 画像が送信されました"
-                        elif mime.startswith("video/"):
-                            text += " 動画が送信されました"
-                        elif mime.startswith("audio/"):
-                            text += " 音声ファイルが送信されました"
-                        else:
-                            text += " ファイルが送信されました"
-                    else:
-                        text += " ファイルが送信されました"
-            if message.mentions:
-                text += " メンションがありました"
-            if message.stickers:
-                text += " スタンプが送信されました"
-
-            await self.tts_queue.put((message.guild, style_id, text))
-
-            if not self.tts_task or self.tts_task.done():
-                self.tts_task = asyncio.create_task(self.tts_worker(message.guild))
+            text = normalize_message(self.bot, message)
+            if not text:
+                return
+
+            await self.get_pipeline(message.guild).queue.put((style_id, text))
         except Exception as e:
             print(f"on_message例外: {e}")
 
-    async def tts_worker(self, guild):
-        self.bot.current_running_cog = "Join"
-        try:
-            while True:
-                try:
-                    try:
-                        guild_obj, style_id, text = await self.tts_queue.get()
-                    except asyncio.CancelledError:
-                        print("TTSワーカーがキャンセルされました（Bot停止/再起動/手動キャンセル）。安全に終了します。")
-                        break
-                    voice_client = guild_obj.voice_client
-                    if not voice_client or not voice_client.is_connected():
-                        continue
+    async def synthesize(self, text, style_id, volume, slots=None, priority=PRIORITY_FIRST_CHUNK):
+        """
+        文を合成して再生用のPCMを返す。短い文は合成キャッシュを使う。
+        slots を渡すとギルドごとの同時合成数もそれで制限する。エンジンの空きは priority の順に回す
+        """
+        key = SynthesisCache.make_key(text, style_id, volume)
+        if key is not None:
+            pcm = await self.synthesis_cache.get(key)
+            if pcm is not None:
+                return pcm
+        async with slots or contextlib.nullcontext(), self.synthesis_slots.slot(priority):
+            query = await self.voicevox.audio_query(text, style_id)
+            query["volumeScale"] = volume
+            wav = await self.voicevox.synthesis(query, style_id)
+        pcm = await asyncio.to_thread(wav_to_discord_pcm, wav)
+        if key is not None:
+            self.synthesis_cache.put(key, wav, pcm)
+        return pcm
 
-                    self.cancel_event.clear()
+    async def synthesize_many(self, texts, style_id, volume, slots=None):
+        """
+        同じ話者の短文をまとめて合成し、PCMのリストを同じ順で返す（失敗した文は例外オブジェクト）。
+        キャッシュに無い文だけを1回の multi_synthesis に載せる
+        """
+        results = [None] * len(texts)
+        keys = [SynthesisCache.make_key(text, style_id, volume) for text in texts]
+        for i, key in enumerate(keys):
+            if key is not None:
+                results[i] = await self.synthesis_cache.get(key)
+        missing = [i for i, pcm in enumerate(results) if pcm is None]
+        if len(missing) >= 2:
+            try:
+                async with slots or contextlib.nullcontext(), self.synthesis_slots.slot(PRIORITY_FIRST_CHUNK):
+                    # 枠は1つなので、エンジンへの要求も1件ずつ送る（全体の同時合成数の上限を守る）
+                    queries = []
+                    for i in missing:
+                        query = await self.voicevox.audio_query(texts[i], style_id)
+                        query["volumeScale"] = volume
+                        queries.append(query)
+                    wavs = await self.voicevox.multi_synthesis(queries, style_id)
+                pcms = await asyncio.to_thread(lambda: [wav_to_discord_pcm(wav) for wav in wavs])
+            except (VoicevoxError, zipfile.BadZipFile, KeyError, ValueError, struct.error) as e:
+                # multi_synthesis が無い古いエンジンや、返ってきたZIP・WAVが壊れているときは1件ずつ合成する
+                print(f"まとめて合成できませんでした: {e}")
+            else:
+                for i, wav, pcm in zip(missing, wavs, pcms):
+                    results[i] = pcm
+                    if keys[i] is not None:
+                        self.synthesis_cache.put(keys[i], wav, pcm)
+                return results
+        synthesized = await asyncio.gather(
+            *(self.synthesize(texts[i], style_id, volume, slots) for i in missing), return_exceptions=True
+        )
+        for i, pcm in zip(missing, synthesized):
+            results[i] = pcm
+        return results
 
-                    async with aiohttp.ClientSession() as session:
-                        try:
-                            async with session.post(
-                                f"http://localhost:{VOICEVOX_PORT}/audio_query",
-                                params={"text": text, "speaker": style_id}
-                            ) as query_resp:
-                                query_resp.raise_for_status()
-                                query = await query_resp.json()
-                        except Exception as exc:
-                            print(f"VOICEVOX audio_queryエラー: {exc}")
-                            continue
-
-                        query["volumeScale"] = settings.get("volume", 0.5)
+    @staticmethod
+    async def take_result(batch, index):
+        # 1件の読み上げを止めても、まとめて合成している他の文は止めない
+        result = (await asyncio.shield(batch))[index]
+        if isinstance(result, BaseException):
+            raise result
+        return result
 
-                        try:
-                            async with session.post(
-                                f"http://localhost:{VOICEVOX_PORT}/synthesis",
-                                params={"speaker": style_id},
-                                json=query
-                            ) as synth_resp:
-                                synth_resp.raise_for_status()
-                                audio = await synth_resp.read()
-                        except Exception as exc:
-                            print(f"VOICEVOX synthesisエラー: {exc}")
-                            continue
+    @staticmethod
+    def is_mergeable(text):
+        text = text.strip()
+        return bool(text) and len(text) <= TTS_CHUNK_MIN_TEXT
 
-                    try:
-                        with open("output.wav", "wb") as f:
-                            f.write(audio)
-                    except Exception as exc:
-                        print(f"音声ファイル保存エラー: {exc}")
-                        continue
-
-                    try:
-                        source = discord.FFmpegPCMAudio("output.wav", executable=FFMPEG_PATH)
-                    except Exception as exc:
-                        print(f"FFmpeg音源生成エラー: {exc}")
-                        continue
-
-                    finished = asyncio.Event()
+    async def gather_burst(self, pipeline, batch):
+        """
+        batch の先頭と同じ話者の短文を待ち行列から集めて batch に足す。
+        まとめられない文を取り出したらそれを返す（次に処理する）。
+        何も再生していないときは最初の文を早く鳴らしたいのでまとめない
+        """
+        style_id = batch[0][0]
+        total = len(batch[0][1])
+        voice_client = pipeline.guild.voice_client
+        if pipeline.ready.empty() and not (voice_client and voice_client.is_playing()):
+            return None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + TTS_MERGE_WINDOW
+        while len(batch) < TTS_MERGE_MAX_MESSAGES:
+            if pipeline.queue.empty():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(pipeline.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = pipeline.queue.get_nowait()
+            if item[0] != style_id or not self.is_mergeable(item[1]) or total + len(item[1]) > TTS_MERGE_MAX_TEXT:
+                return item
+            batch.append(item)
+            total += len(item[1])
+        return None
 
-                    def after_playing(error):
-                        finished.set()
+    def start_synthesis(self, pipeline, batch):
+        """
+        batch の合成を始めて、メッセージごとの Utterance を返す
+        """
+        volume = settings.get("volume", 0.5)
+        if len(batch) == 1:
+            style_id, text = batch[0]
+            return [Utterance([
+                asyncio.create_task(self.synthesize(
+                    chunk, style_id, volume, pipeline.synthesis_slots,
+                    PRIORITY_FIRST_CHUNK if i == 0 else PRIORITY_NEXT_CHUNK
+                ))
+                for i, chunk in enumerate(split_tts_chunks(text))
+            ])]
+        style_id = batch[0][0]
+        merged = asyncio.create_task(
+            self.synthesize_many([text.strip() for _, text in batch], style_id, volume, pipeline.synthesis_slots)
+        )
+        return [Utterance([asyncio.create_task(self.take_result(merged, i))]) for i in range(len(batch))]
 
+    async def synthesis_worker(self, pipeline):
+        """
+        合成段。待ち行列の文を塊に分けて合成を始め、ready に積む。ready が埋まっている間は先へ進まない。
+        同じ話者の短文が続いていれば TTS_MERGE_MAX_MESSAGES 件までまとめて合成する
+        """
+        carried = None
+        while True:
+            if carried is not None:
+                item, carried = carried, None
+            else:
+                item = await pipeline.queue.get()
+            batch = [item]
+            try:
+                voice_client = pipeline.guild.voice_client
+                if not voice_client or not voice_client.is_connected():
+                    continue
+                if TTS_MERGE_ENABLED and self.is_mergeable(item[1]):
+                    carried = await self.gather_burst(pipeline, batch)
+                utterances = self.start_synthesis(pipeline, batch)
+                for i, utterance in enumerate(utterances):
                     try:
-                        if voice_client.is_playing():
-                            voice_client.stop()
-                        voice_client.play(source, after=after_playing)
-                    except Exception as exc:
-                        print(f"音声再生エラー: {exc}")
-                        continue
-                    try:
-                        done, _ = await asyncio.wait(
-                            [finished.wait(), self.cancel_event.wait()],
-                            return_when=asyncio.FIRST_COMPLETED
-                        )
-                    except Exception as exc:
-                        print(f"再生待機エラー: {exc}")
+                        await pipeline.ready.put(utterance)
+                    except asyncio.CancelledError:
+                        for rest in utterances[i:]:
+                            rest.cancel()
+                        raise
+            finally:
+                for _ in batch:
+                    pipeline.queue.task_done()
+
+    async def tts_worker(self, pipeline):
+        """
+        再生段。合成を始めた順に結果を待って再生する（次の文は再生中に合成が進んでいる）。
+        長い文は最初の塊が届いた時点で鳴らし始め、後続の塊は届いた順に継ぎ足す
+        """
+        self.bot.current_running_cog = "Join"
+        try:
+            while True:
+                try:
+                    utterance = await pipeline.ready.get()
+                except asyncio.CancelledError:
+                    print(f"TTSワーカーがキャンセルされました（guild={pipeline.guild.id}）。安全に終了します。")
+                    break
+                try:
+                    await self.play_utterance(pipeline, utterance)
                 except Exception as exc:
                     print(f"読み上げエラー: {exc}")
                 finally:
-                    self.tts_queue.task_done()
+                    utterance.cancel()
         finally:
-            self.bot.current_running_cog = None
+            if self.pipelines.get(pipeline.guild.id) is pipeline and pipeline.task is asyncio.current_task():
+                del self.pipelines[pipeline.guild.id]
+                pipeline.cancel()
+            self.release_running_cog()
+
+    async def play_utterance(self, pipeline, utterance):
+        """
+        1つのメッセージを再生し終えるか、止められるまで待つ
+        """
+        source = None
+        finished = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def after_playing(error):
+            # 音声スレッドから呼ばれるのでイベントループ側でセットする
+            loop.call_soon_threadsafe(finished.set)
+
+        try:
+            for job in utterance.jobs:
+                try:
+                    pcm = await job
+                except Exception as exc:
+                    print(f"音声合成エラー: {exc}")
+                    continue
+                if source is not None:
+                    if finished.is_set() or pipeline.cancel_event.is_set():
+                        # 「ｓ」などで止められたら残りは捨てる
+                        return
+                    source.feed(pcm)
+                    continue
+
+                voice_client = pipeline.guild.voice_client
+                if not voice_client or not voice_client.is_connected():
+                    return
+                pipeline.cancel_event.clear()
+                source = PCMBufferSource(pcm, closed=False)
+                try:
+                    if voice_client.is_playing():
+                        voice_client.stop()
+                    voice_client.play(source, after=after_playing)
+                except Exception as exc:
+                    print(f"音声再生エラー: {exc}")
+                    return
+        finally:
+            if source is not None:
+                source.close()
+        if source is None:
+            return
+
+        try:
+            _, pending = await asyncio.wait(
+                [asyncio.create_task(finished.wait()), asyncio.create_task(pipeline.cancel_event.wait())],
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for waiter in pending:
+                waiter.cancel()
+        except Exception as exc:
+            print(f"再生待機エラー: {exc}")
 
     @tasks.loop(seconds=5)
     async def panel_watcher(self):
@@ -444,5 +1254,17 @@ class Join(commands.Cog):
     @panel_watcher.before_loop
     async def before_panel_watcher(self):        await self.bot.wait_until_ready()
 
+    @tasks.loop(seconds=VOICEVOX_HEALTH_INTERVAL)
+    async def voicevox_health(self):
+        try:
+            await self.voicevox.probe()
+        except Exception as e:
+            print(f"[voicevox_health] 死活確認例外: {e}")
+
+    @voicevox_health.before_loop
+    async def before_voicevox_health(self):
+        await self.bot.wait_until_ready()
+        await asyncio.sleep(VOICEVOX_HEALTH_STARTUP_DELAY)
+
 async def setup(bot):
     await bot.add_cog(Join(bot))
\ No newline at end of file
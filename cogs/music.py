@@ -1,127 +1,1282 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import asyncio
 import yt_dlp
-from collections import deque
+from collections import OrderedDict, Counter
+import itertools
 import config
 import re
-import requests
+import aiohttp
+import os
 import json
+import time
+import threading
+import queue as queue_module
+import unicodedata
+import hashlib
+import math
+from urllib.parse import urlparse, parse_qs
+from cogs.voice_state import find_user_voice_channel
+
+APPLE_MUSIC_CACHE_FILE = config.APPLE_MUSIC_CACHE_PATH
+SEARCH_CACHE_FILE = config.SEARCH_CACHE_PATH
+AUDIO_CACHE_INDEX_FILE = config.AUDIO_CACHE_INDEX_PATH
 
 def is_apple_music_url(url: str) -> bool:
     return "music.apple.com" in url
 
-def get_apple_music_title_jsonld(url: str) -> str:
+APPLE_MUSIC_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+}
+APPLE_MUSIC_TIMEOUT = 10  # 秒
+
+def apple_music_track_id(url: str):
     """
-    Apple Musicのページから<script type="application/ld+json">を抜き出して曲名＋アーティストを取得する方法。
+    Apple MusicのURLから曲IDを取り出す（album/...?i=ID または song/.../ID）
     """
-    try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-        }
-        res = requests.get(url, headers=headers, timeout=10)
-        if res.status_code != 200:
-            return None
+    parsed = urlparse(url)
+    track_ids = parse_qs(parsed.query).get("i")
+    if track_ids:
+        return track_ids[0]
+    m = re.search(r"/song/(?:[^/]+/)?(\d+)", parsed.path)
+    if m:
+        return m.group(1)
+    return None
 
-        scripts = re.findall(r'<script type="application/ld\+json">(.*?)</script>', res.text, re.DOTALL)
-        for script in scripts:
+def parse_apple_music_keyword(html: str):
+    """
+    Apple Musicのページ本文から「曲名 アーティスト」の検索キーワードを作る。
+    <script type="application/ld+json"> を優先し、無ければ <title> から取得する。
+    """
+    scripts = re.findall(r'<script[^>]*type="application/ld\+json"[^>]*>(.*?)</script>', html, re.DOTALL)
+    for script in scripts:
+        try:
             data = json.loads(script)
-            if isinstance(data, dict) and data.get("@type") == "MusicRecording":
-                name = data.get("name")
-                by_artist = data.get("byArtist")
-                if by_artist and isinstance(by_artist, dict):
-                    artist_name = by_artist.get("name")
-                else:
-                    artist_name = None
-                if name and artist_name:
-                    return f"{name} {artist_name}"
-        return None
-    except Exception as e:
-        print(f"[AppleMusic JSON-LD] Error: {e}")
-        return None
+        except ValueError:
+            continue
+        if isinstance(data, dict) and data.get("@type") == "MusicRecording":
+            name = data.get("name")
+            by_artist = data.get("byArtist")
+            if isinstance(by_artist, list) and by_artist:
+                by_artist = by_artist[0]
+            if by_artist and isinstance(by_artist, dict):
+                artist_name = by_artist.get("name")
+            else:
+                artist_name = None
+            if name and artist_name:
+                return f"{name} {artist_name}"
+    m = re.search(r"<title>(.+?) - (.+?) - Apple Music</title>", html)
+    if m:
+        title = m.group(1).strip()
+        artist = m.group(2).strip()
+        return f"{title} {artist}"
+    return None
+
+def load_apple_music_cache():
+    if os.path.exists(APPLE_MUSIC_CACHE_FILE):
+        try:
+            with open(APPLE_MUSIC_CACHE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[AppleMusic] キャッシュ読み込みエラー: {e}")
+    return {}  # {apple_track_id: youtube_url}
 
-def get_apple_music_title_html(url: str) -> str:
+def save_apple_music_cache(data):
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-        }
-        res = requests.get(url, headers=headers, timeout=10)
-        if res.status_code != 200:
-            return None
-        m = re.search(r"<title>(.+?) - (.+?) - Apple Music</title>", res.text)
-        if m:
-            title = m.group(1).strip()
-            artist = m.group(2).strip()
-            return f"{title} {artist}"
+        with open(APPLE_MUSIC_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
     except Exception as e:
-        print(f"[AppleMusic HTML] Error: {e}")
-    return None
+        print(f"[AppleMusic] キャッシュ保存エラー: {e}")
 
-def get_youtube_url_by_keyword(keyword: str) -> str:
-    """
-    キーワードでYouTube検索し、最初の動画のURLを返す
-    """
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'noplaylist': True,
-        'quiet': True,
-        'default_search': 'ytsearch1', 
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(keyword, download=False)
-        if 'entries' in info and info['entries']:
-            return info['entries'][0]['webpage_url']
-        if 'webpage_url' in info:
-            return info['webpage_url']
-    return None
+class AppleMusicResolver:
+    """
+    Apple Musicのリンクを検索キーワードに変換する。
+    ページは共有のaiohttpセッションで1回だけ取得し、曲ID→YouTube URLの対応はディスクに保存する。
+    """
+    def __init__(self):
+        self.session = None
+        self.mapping = load_apple_music_cache()
+        self.dirty = False  # 未保存の対応があるか
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers=APPLE_MUSIC_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=APPLE_MUSIC_TIMEOUT),
+            )
+        return self.session
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    def lookup(self, url):
+        track_id = apple_music_track_id(url)
+        if track_id:
+            return self.mapping.get(track_id)
+        return None
+
+    def remember(self, url, youtube_url):
+        track_id = apple_music_track_id(url)
+        if track_id and self.mapping.get(track_id) != youtube_url:
+            self.mapping[track_id] = youtube_url
+            # その場では書かず、flush() でまとめて書き出す
+            self.dirty = True
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        await asyncio.to_thread(save_apple_music_cache, dict(self.mapping))
+
+    async def fetch_keyword(self, url):
+        try:
+            session = await self.get_session()
+            async with session.get(url) as res:
+                if res.status != 200:
+                    return None
+                html = await res.text()
+            return parse_apple_music_keyword(html)
+        except Exception as e:
+            print(f"[AppleMusic] Error: {e}")
+            return None
 
 def is_youtube_playlist_url(url: str) -> bool:
     return "youtube.com/playlist?list=" in url or "youtu.be/playlist?list=" in url
 
-def extract_youtube_playlist_video_urls(playlist_url: str) -> list:
+PLAYLIST_YDL_OPTS = {
+    'quiet': True,
+    'extract_flat': True,
+    'skip_download': True,
+}
+PLAYLIST_PROGRESS_INTERVAL = 3  # 秒。プレイリスト読み込み進捗メッセージの更新間隔
+EMBED_UPDATE_INTERVAL = 1.5  # 秒。再生中埋め込みを編集する最短間隔
+
+# Trueならffmpeg側で音量調整とOpusエンコードを行い、Botはパケットを転送するだけにする。
+# FalseでPCM出力＋PCMVolumeTransformer（Python側で音量調整・Opusエンコード）の従来経路
+OPUS_OUTPUT = True
+OPUS_BITRATE = 128  # kbps
+FRAME_SECONDS = 0.02  # discord.pyの1フレーム（20ms）
+TRANSITION_MAX_RETRIES = 1  # 再生・解決に失敗した曲をやり直す回数
+RESUME_MIN_REMAINING = 5  # 秒。残りがこれより長いのに音源が終わったら途中終了とみなして続きから再開する
+RESUME_PROGRESS_SECONDS = 10  # 秒。前回の再開からこれだけ進んでいれば再試行回数を数え直す
+VOLUME_RESTART_DELAY = 0.3  # 秒。音量ボタンの連打はまとめてからffmpegを張り替える
+FFMPEG_RECONNECT_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+
+def parse_timestamp(text: str):
     """
-    YouTubeプレイリストURLから全動画のURLリストを返す
-    存在しない場合は空リストを返す
+    "90" / "1:30" / "1:02:03" を秒数にする。解釈できなければNone
     """
-    ydl_opts = {
-        'quiet': True,
-        'extract_flat': True,
-        'skip_download': True,
-    }
-    urls = []
+    parts = text.strip().split(":")
+    if len(parts) > 3:
+        return None
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(playlist_url, download=False)
-            for entry in info.get('entries', []):
-                if 'url' in entry:
-                    video_id = entry['url']
-                    urls.append(f"https://www.youtube.com/watch?v={video_id}")
-    except Exception as e:
-        print(f"[yt_dlp] プレイリスト取得失敗: {e}")
-        # ここで空リストを返すことで、コマンド側で「取得失敗」と案内できる
-        return []
-    return urls
+        values = [float(part) for part in parts]
+    except ValueError:
+        return None
+    if any(not math.isfinite(value) or value < 0 for value in values):
+        # "nan" や "inf" も float() は受け付けるので弾く
+        return None
+    seconds = 0.0
+    for value in values:
+        seconds = seconds * 60 + value
+    return seconds if math.isfinite(seconds) else None
 
-class Music(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
+def format_timestamp(seconds) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+def playlist_entry_url(entry: dict):
+    """
+    extract_flatのエントリから再生用の動画URLを組み立てる
+    """
+    if entry.get('id'):
+        return f"https://www.youtube.com/watch?v={entry['id']}"
+    url = entry.get('url')
+    if not url:
+        return None
+    if url.startswith("http"):
+        return url
+    return f"https://www.youtube.com/watch?v={url}"
+
+def entry_thumbnail(entry: dict):
+    if entry.get('thumbnail'):
+        return entry['thumbnail']
+    thumbnails = entry.get('thumbnails') or []
+    # 一覧は小さい順に並んでいる
+    return thumbnails[-1].get('url') if thumbnails else None
+
+async def stream_youtube_playlist_entries(playlist_url: str):
+    """
+    YouTubeプレイリストのエントリを取得できた順に1件ずつ返す非同期ジェネレータ。
+    yt-dlpのページ送りは専用スレッドで行うため、イベントループは止まらない。
+    """
+    loop = asyncio.get_running_loop()
+    entries = asyncio.Queue()
+    finished = object()
+    stop = threading.Event()
+
+    def post(item):
+        try:
+            loop.call_soon_threadsafe(entries.put_nowait, item)
+        except RuntimeError:
+            # ループ終了後は捨てる
+            stop.set()
+
+    def produce():
+        try:
+            with yt_dlp.YoutubeDL(PLAYLIST_YDL_OPTS) as ydl:
+                # process=False だとentriesがページ単位で遅延取得されるジェネレータのまま返る
+                info = ydl.extract_info(playlist_url, download=False, process=False)
+                for entry in info.get('entries') or []:
+                    if stop.is_set():
+                        break
+                    if entry:
+                        post(entry)
+        except Exception as e:
+            print(f"[yt_dlp] プレイリスト取得失敗: {e}")
+            post(e)
+        finally:
+            post(finished)
+
+    threading.Thread(target=produce, name="yt-dlp-playlist", daemon=True).start()
+    try:
+        while True:
+            item = await entries.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+PREFETCH_DEPTH = 2  # 再生中に先読みするキューの曲数
+STREAM_EXPIRE_MARGIN = 300  # 秒。期限切れ間近のストリームURLは再解決する
+EXTRACT_CACHE_SIZE = 256  # 解決結果を保持する最大曲数
+EXTRACT_CACHE_DEFAULT_TTL = 1800  # 秒。expire= を持たないURLの保持時間
+
+EXTRACT_WORKERS = 4  # yt-dlp抽出ワーカースレッド数
+EXTRACT_MAX_BACKGROUND_JOBS = 64  # 先読みなど後回しにできるジョブの待ち上限
+EXTRACT_TIMEOUT = 30  # 秒。1ジョブの待ち時間上限
+PRIORITY_NOW_PLAYING = 0  # 今すぐ再生する曲
+PRIORITY_PREFETCH = 10  # 先読み・バックグラウンド処理
+PRIORITY_METADATA = 20  # キュー表示用の曲情報の取得
+
+METADATA_CACHE_SIZE = 4096  # 曲情報（タイトル・長さ・サムネイル）を保持する最大曲数
+METADATA_WORKERS = 2  # キューの曲情報を同時に取得する数
+QUEUE_TITLE_MAX_LENGTH = 60  # キュー表示で切り詰めるタイトルの長さ
+
+MUSIC_YDL_OPTS = {
+    'format': 'bestaudio/best',
+    'noplaylist': True,
+    'quiet': True,
+    'default_search': 'ytsearch'
+}
+
+SEARCH_YDL_OPTS = {
+    'quiet': True,
+    'noplaylist': True,
+    'extract_flat': 'in_playlist',
+    'default_search': 'ytsearch1',
+}
+
+SEARCH_CACHE_SIZE = 2000  # 保存する検索語の最大数
+SEARCH_CACHE_TTL = 7 * 24 * 3600  # 秒。これより古い結果は返しつつ裏で検索し直す
+CACHE_FLUSH_INTERVAL = 30  # 秒。キャッシュの変更をまとめてファイルに書き出す間隔
+
+YOUTUBE_VIDEO_ID_PATTERN = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([A-Za-z0-9_-]{11})'
+)
+
+def select_audio_format(info: dict) -> dict:
+    """
+    yt-dlpのinfoから再生に使う音声フォーマット（url, format_id, acodec, ext を含むdict）を選ぶ
+    """
+    if 'url' in info:
+        return info
+    return max(
+        [f for f in info.get('formats', []) if f.get('acodec') != 'none' and f.get('url')],
+        key=lambda f: f.get('abr') or 0)
+
+def extract_video_id(url: str):
+    """
+    YouTubeのURLから11桁の動画IDを取り出す。YouTube以外・検索キーワードはNone
+    """
+    m = YOUTUBE_VIDEO_ID_PATTERN.search(url)
+    return m.group(1) if m else None
+
+def parse_stream_expire(stream_url: str):
+    """
+    googlevideoのURLに含まれる expire= (UNIX時刻) を返す。無ければNone
+    """
+    try:
+        values = parse_qs(urlparse(stream_url).query).get("expire")
+        if values:
+            return float(values[0])
+    except Exception:
+        pass
+    return None
+
+class ResolvedTrack:
+    """
+    再生可能な状態まで解決済みの曲（ストリームURL・タイトル・長さ・期限）
+    """
+    def __init__(self, url, stream_url, title, duration=None, expire=None,
+                 video_id=None, format_id=None, acodec=None, ext=None, is_local=False, thumbnail=None):
+        self.url = url
+        self.stream_url = stream_url
+        self.title = title
+        self.duration = duration
+        self.expire = expire
+        self.video_id = video_id
+        self.format_id = format_id
+        self.acodec = acodec
+        self.ext = ext
+        self.is_local = is_local  # stream_url がローカル音声キャッシュのファイル
+        self.thumbnail = thumbnail
+
+    @classmethod
+    def from_info(cls, url, info):
+        fmt = select_audio_format(info)
+        stream_url = fmt['url']
+        return cls(
+            url,
+            stream_url,
+            info.get('title', 'Unknown Title'),
+            duration=info.get('duration'),
+            expire=parse_stream_expire(stream_url),
+            video_id=info.get('id'),
+            format_id=fmt.get('format_id'),
+            acodec=fmt.get('acodec'),
+            ext=fmt.get('ext'),
+            thumbnail=entry_thumbnail(info),
+        )
+
+    def is_fresh(self, margin=STREAM_EXPIRE_MARGIN):
+        # 期限が分からないURLは使える前提で扱う
+        if self.expire is None:
+            return True
+        return time.time() + margin < self.expire
+
+class ExtractQueueFull(Exception):
+    pass
+
+class ExtractJob:
+    """
+    抽出キューに積んだ1件のジョブ。優先度を上げるときは同じジョブを積み直し、先に取り出された方だけを実行する
+    """
+    def __init__(self, fut, loop, url, ydl_opts, kwargs, priority, background, key):
+        self.fut = fut
+        self.loop = loop
+        self.url = url
+        self.ydl_opts = ydl_opts
+        self.kwargs = kwargs
+        self.priority = priority
+        self.background = background  # 後回しにできるジョブの上限に数えているか
+        self.key = key
+        self.started = False
+
+class ExtractorPool:
+    """
+    yt-dlp抽出専用のワーカースレッド群。
+    各ワーカーはオプションごとにYoutubeDLを保持して使い回し、ジョブは優先度の小さい順に処理する。
+    タイムアウトしたジョブは呼び出し側に例外を返し、未着手なら破棄される。
+    key をつけて積んだ未着手のジョブは raise_priority() で優先度を上げられる。
+    """
+    def __init__(self, workers=EXTRACT_WORKERS, max_background_jobs=EXTRACT_MAX_BACKGROUND_JOBS):
+        self.jobs = queue_module.PriorityQueue()
+        self.counter = itertools.count()
+        self.max_background_jobs = max_background_jobs
+        self.background_jobs = 0
+        self.pending = {}  # key: 未着手のExtractJob
+        self.lock = threading.Lock()
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"yt-dlp-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    async def extract(self, url, ydl_opts, priority=PRIORITY_NOW_PLAYING, timeout=EXTRACT_TIMEOUT, key=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        background = priority > PRIORITY_NOW_PLAYING
+        job = ExtractJob(fut, loop, url, ydl_opts, kwargs, priority, background, key)
+        with self.lock:
+            if background:
+                if self.background_jobs >= self.max_background_jobs:
+                    raise ExtractQueueFull("抽出キューが満杯です")
+                self.background_jobs += 1
+            if key is not None:
+                self.pending[key] = job
+        self.jobs.put((priority, next(self.counter), job))
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            with self.lock:
+                if key is not None and self.pending.get(key) is job:
+                    del self.pending[key]
+
+    def raise_priority(self, key, priority):
+        """
+        未着手のジョブをより急ぐ優先度で積み直す。着手済み・見つからなければFalse
+        """
+        with self.lock:
+            job = self.pending.get(key)
+            if job is None or job.started or priority >= job.priority:
+                return False
+            job.priority = priority
+            if job.background and priority <= PRIORITY_NOW_PLAYING:
+                job.background = False
+                self.background_jobs -= 1
+        self.jobs.put((priority, next(self.counter), job))
+        return True
+
+    def shutdown(self):
+        for _ in self.threads:
+            self.jobs.put((float("inf"), next(self.counter), None))
+
+    def _worker(self):
+        ydls = {}  # オプションのキー: YoutubeDL
+        while True:
+            _, _, job = self.jobs.get()
+            if job is None:
+                break
+            with self.lock:
+                if job.started:
+                    # 優先度を上げて積み直したジョブの残り
+                    continue
+                job.started = True
+                if job.background:
+                    job.background = False
+                    self.background_jobs -= 1
+                if self.pending.get(job.key) is job:
+                    del self.pending[job.key]
+            fut, loop, url, ydl_opts, kwargs = job.fut, job.loop, job.url, job.ydl_opts, job.kwargs
+            if fut.done():
+                # タイムアウト・キャンセル済みのジョブは実行しない
+                continue
+            key = json.dumps(ydl_opts, sort_keys=True, default=str)
+            try:
+                ydl = ydls.get(key)
+                if ydl is None:
+                    ydl = yt_dlp.YoutubeDL(ydl_opts)
+                    ydls[key] = ydl
+                result = ydl.extract_info(url, download=False, **kwargs)
+            except Exception as e:
+                loop.call_soon_threadsafe(self._set_exception, fut, e)
+            else:
+                loop.call_soon_threadsafe(self._set_result, fut, result)
+        for ydl in ydls.values():
+            try:
+                ydl.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _set_result(fut, result):
+        if not fut.done():
+            fut.set_result(result)
+
+    @staticmethod
+    def _set_exception(fut, exc):
+        if not fut.done():
+            fut.set_exception(exc)
+
+class ExtractCache:
+    """
+    動画IDをキーにした yt-dlp 解決結果のLRUキャッシュ。
+    各エントリはストリームURLの expire= まで有効で、同じIDへの同時要求は1回の抽出にまとめる。
+    """
+    def __init__(self, max_size=EXTRACT_CACHE_SIZE, default_ttl=EXTRACT_CACHE_DEFAULT_TTL):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()  # video_id: ResolvedTrack
+        self.inflight = {}  # video_id: (抽出中のFuture, 優先度)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, video_id):
+        track = self.entries.get(video_id)
+        if track is None:
+            return None
+        if not track.is_fresh():
+            del self.entries[video_id]
+            return None
+        self.entries.move_to_end(video_id)
+        return track
+
+    def put(self, video_id, track):
+        if track.expire is None:
+            track.expire = time.time() + self.default_ttl
+        self.entries[video_id] = track
+        self.entries.move_to_end(video_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, video_id):
+        self.entries.pop(video_id, None)
+
+    async def get_or_load(self, video_id, loader, priority=PRIORITY_NOW_PLAYING, escalate=None, retry=True):
+        """
+        キャッシュにあればそれを返し、無ければ loader(priority) で解決する。
+        抽出中の同じIDへの要求は同じFutureを待つ（single-flight）。
+        抽出中のものより急ぐ要求が来たら escalate(priority) でそのジョブの優先度を上げる
+        （裏の曲情報取得に再生中の曲が引きずられないように）。
+        相乗りしたジョブが満杯で断られた・時間切れになったときだけ、自分の優先度で抽出し直す。
+        """
+        track = self.get(video_id)
+        if track is not None:
+            self.hits += 1
+            return track
+        inflight = self.inflight.get(video_id)
+        if inflight is None:
+            self.misses += 1
+            fut = asyncio.ensure_future(self._load(video_id, loader, priority))
+            self.inflight[video_id] = (fut, priority)
+            fut.add_done_callback(lambda f: self._on_loaded(video_id, f))
+            # 呼び出し側がキャンセルされても抽出自体は続けて結果をキャッシュする
+            return await asyncio.shield(fut)
+
+        fut, inflight_priority = inflight
+        if priority < inflight_priority:
+            self.inflight[video_id] = (fut, priority)
+            if escalate is not None:
+                escalate(priority)
+        try:
+            return await asyncio.shield(fut)
+        except (ExtractQueueFull, asyncio.TimeoutError):
+            if not retry:
+                raise
+            return await self.get_or_load(video_id, loader, priority, escalate, retry=False)
+
+    async def _load(self, video_id, loader, priority):
+        # 積む前に急ぐ要求が来ていたらその優先度で積む（まだ escalate で上げるジョブが無いため）
+        inflight = self.inflight.get(video_id)
+        if inflight is not None:
+            priority = min(priority, inflight[1])
+        return await loader(priority)
+
+    def _on_loaded(self, video_id, fut):
+        if self.inflight.get(video_id, (None,))[0] is fut:
+            del self.inflight[video_id]
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        self.put(video_id, fut.result())
+
+class TrackMetadata:
+    """
+    キュー・埋め込みに表示する曲情報。分からない項目はNone
+    """
+    def __init__(self, title=None, duration=None, thumbnail=None):
+        self.title = title
+        self.duration = duration
+        self.thumbnail = thumbnail
+
+    @classmethod
+    def from_entry(cls, entry: dict):
+        """
+        extract_flat のエントリ（プレイリスト・検索結果）から作る
+        """
+        return cls(entry.get('title'), entry.get('duration'), entry_thumbnail(entry))
+
+    @classmethod
+    def from_track(cls, track):
+        return cls(track.title, track.duration, track.thumbnail)
+
+    def merged(self, other):
+        """
+        other で分かっている項目を優先し、足りない項目は自分の値で埋めたものを返す
+        """
+        return TrackMetadata(
+            other.title or self.title,
+            other.duration or self.duration,
+            other.thumbnail or self.thumbnail,
+        )
+
+class MetadataCache:
+    """
+    動画ID(またはURL)→曲情報のLRUキャッシュ。
+    プレイリスト・検索のflat結果、再生用の解決結果、キューの補完処理がすべてここに書き込む。
+    """
+    def __init__(self, max_size=METADATA_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # key: TrackMetadata
+
+    def get(self, key):
+        metadata = self.entries.get(key)
+        if metadata is not None:
+            self.entries.move_to_end(key)
+        return metadata
+
+    def put(self, key, metadata):
+        current = self.entries.get(key)
+        if current is not None:
+            metadata = current.merged(metadata)
+        self.entries[key] = metadata
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return metadata
+
+def format_queue_title(entry):
+    """
+    キュー表示の1行分。曲情報がまだ無ければURLをそのまま出す
+    """
+    if not entry.title:
+        return entry.url
+    title = entry.title
+    if len(title) > QUEUE_TITLE_MAX_LENGTH:
+        title = title[:QUEUE_TITLE_MAX_LENGTH - 1] + "…"
+    title = discord.utils.escape_markdown(title)
+    if entry.duration:
+        return f"{title}（{format_timestamp(entry.duration)}）"
+    return title
+
+class QueueEntry:
+    """
+    キュー内の1曲。idはキュー内で一意で、削除・移動の指定に使う。
+    title/duration/thumbnail は後から補完されるので、分かるまではNone
+    """
+    def __init__(self, entry_id, url, user):
+        self.id = entry_id
+        self.url = url
+        self.user = user
+        # 同じ動画を別表記のURLで追加しても重複と判定できるよう動画IDを優先
+        self.key = extract_video_id(url) or url
+        self.title = None
+        self.duration = None
+        self.thumbnail = None
+
+class TrackQueue:
+    """
+    エントリIDつきの再生待ちキュー。
+    IDでの削除・先頭への移動・重複判定・リクエスト者ごとの件数をO(1)で扱い、
+    ページ表示はコピーせずに必要な範囲だけ読み出す。
+    残り時間は曲情報が分かった時点で合計に足しておくので、表示時に走査しない。
+    """
+    def __init__(self):
+        self.entries = OrderedDict()  # entry_id: QueueEntry
+        self.ids = itertools.count(1)
+        self.requester_counts = Counter()  # user_id: 件数
+        self.key_counts = Counter()  # 動画ID(またはURL): 件数
+        self.total_duration = 0.0  # 長さが分かっている曲の合計（秒）
+        self.unknown_durations = 0  # 長さが分からない曲の数
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def append(self, url, user):
+        entry = QueueEntry(next(self.ids), url, user)
+        self.entries[entry.id] = entry
+        self._count(entry, 1)
+        return entry
+
+    def set_metadata(self, entry, metadata):
+        """
+        エントリに曲情報を反映する。すでにキューから外れたエントリなら何もしない
+        """
+        if self.entries.get(entry.id) is not entry:
+            return False
+        self._count_duration(entry, -1)
+        entry.title = metadata.title or entry.title
+        entry.duration = metadata.duration or entry.duration
+        entry.thumbnail = metadata.thumbnail or entry.thumbnail
+        self._count_duration(entry, 1)
+        return True
+
+    def popleft(self):
+        if not self.entries:
+            raise IndexError("キューは空です")
+        _, entry = self.entries.popitem(last=False)
+        self._count(entry, -1)
+        return entry
+
+    def get(self, entry_id):
+        return self.entries.get(entry_id)
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is not None:
+            self._count(entry, -1)
+        return entry
+
+    def move_to_front(self, entry_id):
+        if entry_id not in self.entries:
+            return False
+        self.entries.move_to_end(entry_id, last=False)
+        return True
+
+    def contains_url(self, url):
+        return self.key_counts[extract_video_id(url) or url] > 0
+
+    def count_for(self, user):
+        return self.requester_counts[getattr(user, "id", None)]
+
+    def slice(self, start, stop):
+        return list(itertools.islice(self.entries.values(), start, stop))
+
+    def clear(self):
+        self.entries.clear()
+        self.requester_counts.clear()
+        self.key_counts.clear()
+        self.total_duration = 0.0
+        self.unknown_durations = 0
+
+    def _count(self, entry, delta):
+        for counter, key in ((self.requester_counts, getattr(entry.user, "id", None)), (self.key_counts, entry.key)):
+            counter[key] += delta
+            if counter[key] <= 0:
+                del counter[key]
+        self._count_duration(entry, delta)
+
+    def _count_duration(self, entry, delta):
+        if entry.duration:
+            self.total_duration += delta * entry.duration
+        else:
+            self.unknown_durations += delta
+
+class TrackedSource(discord.AudioSource):
+    """
+    1曲分の音源ラッパー。読み出したフレーム数から再生位置（秒）を数え、
+    再生を止めずに中身のffmpeg音源を差し替えられる（音量変更など）。
+    """
+    def __init__(self, inner, start=0.0):
+        self.inner = inner
+        self.start = start
+        self.frames = 0
+        self.pending = None  # 差し替え時に先読みした最初のフレーム
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @property
+    def position(self):
+        return self.start + self.frames * FRAME_SECONDS
+
+    def read(self):
+        with self.lock:
+            if self.pending is not None:
+                data, self.pending = self.pending, None
+            else:
+                data = self.inner.read()
+            if data:
+                self.frames += 1
+            return data
+
+    def is_opus(self):
+        return self.inner.is_opus()
+
+    def replace(self, inner, start, first_frame):
+        """
+        中身の音源を差し替える。音声スレッドのread()とはロックで排他するので途切れない
+        """
+        with self.lock:
+            if self.closed:
+                old = inner
+            else:
+                old = self.inner
+                self.inner = inner
+                self.start = start
+                self.frames = 0
+                self.pending = first_frame
+        old.cleanup()
+
+    def cleanup(self):
+        with self.lock:
+            self.closed = True
+        self.inner.cleanup()
+
+def prime_source(source, start, tracked):
+    """
+    新しい音源を tracked の現在位置まで読み進め、(位置, 次のフレーム) を返す。
+    ffmpegの読み出しはブロックするので別スレッドで呼ぶこと。
+    """
+    frames = 0
+    while True:
+        data = source.read()
+        position = start + frames * FRAME_SECONDS
+        if not data:
+            return position, b""
+        if position >= tracked.position:
+            return position, data
+        frames += 1
+
+class EmbedUpdater:
+    """
+    再生中埋め込みの更新要求をまとめる。
+    request() はすぐ戻り、EMBED_UPDATE_INTERVAL の間に来た要求は最新状態での1回の編集に集約される。
+    """
+    def __init__(self, render, interval=EMBED_UPDATE_INTERVAL):
+        self.render = render  # async def render(channel)
+        self.interval = interval
+        self.channel = None
+        self.dirty = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.task = None
+        self.last_sent = 0.0
+
+    def request(self, channel):
+        self.channel = channel
+        self.dirty.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def flush(self, channel):
+        """
+        待たずにすぐ描画する（曲の切り替わりなど）。保留中の要求もこれで満たされる。
+        """
+        self.channel = channel
+        self.dirty.clear()
+        await self._render()
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+        self.dirty.clear()
+
+    async def _run(self):
+        try:
+            while self.dirty.is_set():
+                wait = self.last_sent + self.interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if not self.dirty.is_set():
+                    break
+                self.dirty.clear()
+                await self._render()
+        except asyncio.CancelledError:
+            pass
+
+    async def _render(self):
+        async with self.lock:
+            try:
+                # レート制限に当たった場合はdiscord.pyが待機するので、その間の要求も次の1回にまとまる
+                await self.render(self.channel)
+            except Exception as e:
+                print(f"[EmbedUpdater] 埋め込み更新失敗: {e}")
+            self.last_sent = time.monotonic()
+
+def normalize_search_query(query: str) -> str:
+    """
+    全角/半角・大文字/小文字・空白の違いを吸収した検索キャッシュのキー
+    """
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+def is_url(text: str) -> bool:
+    return re.match(r"https?://", text.strip()) is not None
+
+class SearchCache:
+    """
+    正規化した検索語→動画IDのLRUキャッシュ。memory/ に保存して再起動後も使う。
+    SEARCH_CACHE_TTL を過ぎた結果もまず返し、呼び出し側が裏で検索し直す。
+    """
+    def __init__(self, path=SEARCH_CACHE_FILE, max_size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # query: {"video_id": str, "updated": UNIX時刻}
+        self.refreshing = set()
+        self.dirty = False  # 未保存の変更があるか
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # 保存時は古い順に並んでいる
+            for query, entry in data.items():
+                self.entries[query] = entry
+        except Exception as e:
+            print(f"[SearchCache] 読み込みエラー: {e}")
+
+    def save(self):
+        # 検索のたびには書かず、flush() でまとめて書き出す
+        self.dirty = True
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        data = json.dumps(self.entries, ensure_ascii=False)
+        await asyncio.to_thread(self._write, data)
+
+    def _write(self, data):
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(data)
+        except Exception as e:
+            print(f"[SearchCache] 保存エラー: {e}")
+
+    def get(self, query):
+        """
+        (video_id, 古いかどうか) を返す。無ければNone
+        """
+        entry = self.entries.get(query)
+        if entry is None:
+            return None
+        self.entries.move_to_end(query)
+        stale = time.time() - entry.get("updated", 0) > self.ttl
+        return entry["video_id"], stale
+
+    def put(self, query, video_id):
+        self.entries[query] = {"video_id": video_id, "updated": time.time()}
+        self.entries.move_to_end(query)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        self.save()
+
+AUDIO_CACHE_DIR = os.path.join("music", "cache")  # playlist.py の music/ と同じ場所に置く
+AUDIO_CACHE_MIN_PLAYS = 3  # この回数再生された曲をローカルに保存する
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 保存する音声の合計サイズ上限
+AUDIO_CACHE_MAX_TRACK_SECONDS = 20 * 60  # これより長い曲（作業用BGMなど）は保存しない
+AUDIO_CACHE_MAX_PLAY_COUNTS = 10000  # 再生回数を覚えておく曲数の上限
+AUDIO_CACHE_DOWNLOAD_TIMEOUT = 300  # 秒
+
+class AudioCache:
+    """
+    よく再生される曲の音声を music/cache/<sha256>.opus に保存する内容アドレス型キャッシュ。
+    AUDIO_CACHE_MIN_PLAYS 回再生された曲を裏でOpusに保存し、以降はYouTubeに問い合わせずに再生する。
+    合計が AUDIO_CACHE_MAX_BYTES を超えたら最後に使われたのが古い順に消し、
+    ファイルは起動後の初回使用時にサイズとハッシュを確かめる。
+    """
+    def __init__(self, directory=AUDIO_CACHE_DIR, index_path=AUDIO_CACHE_INDEX_FILE,
+                 min_plays=AUDIO_CACHE_MIN_PLAYS, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.index_path = index_path
+        self.min_plays = min_plays
+        self.max_bytes = max_bytes
+        self.plays = Counter()  # video_id: 再生回数
+        self.files = {}  # video_id: {"sha256", "size", "title", "duration", "last_used", "hits"}
+        self.verified = set()  # この起動中に中身を確認済みのvideo_id
+        self.storing = set()  # 保存処理中のvideo_id
+        self.dirty = False  # 未保存の変更があるか
+        os.makedirs(self.directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.plays.update(data.get("plays", {}))
+            self.files.update(data.get("files", {}))
+        except Exception as e:
+            print(f"[AudioCache] 読み込みエラー: {e}")
+
+    def save(self):
+        # 再生のたびには書かず、flush() でまとめて書き出す
+        self.dirty = True
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        data = json.dumps({"plays": self.plays, "files": self.files}, ensure_ascii=False)
+        await asyncio.to_thread(self._write, data)
+
+    def _write(self, data):
+        try:
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                f.write(data)
+        except Exception as e:
+            print(f"[AudioCache] 保存エラー: {e}")
+
+    def path_for(self, digest):
+        return os.path.join(self.directory, f"{digest}.opus")
+
+    @staticmethod
+    def hash_file(path):
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+
+    def _verify(self, entry):
+        path = self.path_for(entry["sha256"])
+        try:
+            if os.path.getsize(path) != entry["size"]:
+                return False
+            return self.hash_file(path)[0] == entry["sha256"]
+        except OSError:
+            return False
+
+    async def lookup(self, video_id, url):
+        """
+        保存済みならローカルファイルを指す ResolvedTrack を返す。無い・壊れていればNone
+        """
+        entry = self.files.get(video_id)
+        if entry is None:
+            return None
+        if video_id not in self.verified:
+            if not await asyncio.to_thread(self._verify, entry):
+                print(f"[AudioCache] 破損したキャッシュを破棄: {video_id}")
+                self.drop(video_id)
+                self.save()
+                return None
+            self.verified.add(video_id)
+        return ResolvedTrack(
+            url,
+            self.path_for(entry["sha256"]),
+            entry.get("title") or "Unknown Title",
+            duration=entry.get("duration"),
+            video_id=video_id,
+            acodec="opus",
+            ext="opus",
+            is_local=True,
+        )
+
+    def record_play(self, track):
+        """
+        再生回数を数え、今この曲を保存し始めるべきならTrueを返す。
+        保存済みの曲なら最終使用時刻と再生回数だけ更新する（曲情報の取得や先読みでは数えない）
+        """
+        video_id = track.video_id
+        if not video_id:
+            return False
+        if track.is_local:
+            entry = self.files.get(video_id)
+            if entry is not None:
+                entry["last_used"] = time.time()
+                entry["hits"] = entry.get("hits", 0) + 1
+                self.save()
+            return False
+        self.plays[video_id] += 1
+        if len(self.plays) > AUDIO_CACHE_MAX_PLAY_COUNTS:
+            # 1回しか再生されていない曲から忘れる
+            for forgotten, _ in self.plays.most_common()[AUDIO_CACHE_MAX_PLAY_COUNTS // 2:]:
+                del self.plays[forgotten]
+        self.save()
+        if self.plays.get(video_id, 0) < self.min_plays:
+            return False
+        if video_id in self.files or video_id in self.storing:
+            return False
+        if track.duration and track.duration > AUDIO_CACHE_MAX_TRACK_SECONDS:
+            return False
+        return True
+
+    async def store(self, track):
+        """
+        ストリームをOpus(Ogg)で保存する。元がOpusなら再エンコードせずにコピーする
+        """
+        video_id = track.video_id
+        self.storing.add(video_id)
+        partial = os.path.join(self.directory, f"{video_id}.part")
+        codec = ["-c:a", "copy"] if track.acodec == "opus" else ["-c:a", "libopus", "-b:a", f"{OPUS_BITRATE}k"]
+        args = [
+            config.FFMPEG_PATH, "-y", "-loglevel", "error",
+            *FFMPEG_RECONNECT_OPTIONS.split(), "-i", track.stream_url,
+            "-vn", "-map_metadata", "-1", *codec, "-f", "opus", partial,
+        ]
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+            try:
+                returncode = await asyncio.wait_for(proc.wait(), AUDIO_CACHE_DOWNLOAD_TIMEOUT)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise
+            if returncode != 0:
+                raise RuntimeError(f"ffmpeg終了コード {returncode}")
+            digest, size = await asyncio.to_thread(self.hash_file, partial)
+            # 同じ中身なら同じファイル名になるので、別IDの同一音源は1つにまとまる
+            os.replace(partial, self.path_for(digest))
+            self.files[video_id] = {
+                "sha256": digest,
+                "size": size,
+                "title": track.title,
+                "duration": track.duration,
+                "last_used": time.time(),
+                "hits": 0,
+            }
+            self.verified.add(video_id)
+            self.evict()
+            self.save()
+        except Exception as e:
+            print(f"[AudioCache] 保存失敗: {video_id} ({e!r})")
+        finally:
+            self.storing.discard(video_id)
+            if os.path.exists(partial):
+                try:
+                    os.remove(partial)
+                except OSError:
+                    pass
+
+    def drop(self, video_id):
+        entry = self.files.pop(video_id, None)
+        self.verified.discard(video_id)
+        if entry is None:
+            return
+        # 他のIDが同じ中身を指していればファイルは残す
+        if any(other["sha256"] == entry["sha256"] for other in self.files.values()):
+            return
+        try:
+            os.remove(self.path_for(entry["sha256"]))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[AudioCache] 削除失敗: {e}")
+
+    def total_bytes(self):
+        sizes = {entry["sha256"]: entry["size"] for entry in self.files.values()}
+        return sum(sizes.values())
+
+    def evict(self):
+        while self.files and self.total_bytes() > self.max_bytes:
+            oldest = min(self.files, key=lambda video_id: self.files[video_id].get("last_used", 0))
+            self.drop(oldest)
+
+PLAYER_IDLE_TIMEOUT = 300  # 秒。VC未接続かつキュー空のプレイヤーを破棄するまでの猶予
+
+class GuildPlayer:
+    """
+    ギルドごとの再生状態。キュー・VC・再生中の曲・音量・ループ・埋め込みを保持する。
+    """
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
         self.preparing_message = None
         self.current_embed_message = None
         self.voice_client = None
-        self.queue = deque()
+        self.queue = TrackQueue()
         self.now_playing = None
         self.now_playing_url = None
-        self.now_playing_requester = None  # ★追加
+        self.now_playing_requester = None
         self.volume_level = 0.3
         self.is_paused = False
         self.is_looping = False
+        self.current_track = None
+        self.current_source = None  # 再生中の TrackedSource（再生位置の取得・差し替えに使う）
+        self.resume_position = None  # 途中終了した曲を再開した位置（秒）
+        self.skip_requested = False
+        self.prefetched = {}  # url: ResolvedTrack
+        self.prefetch_task = None
+        self.ingest_task = None
+        self.waiting_for_ingest = False
+        self.embed_updater = None
+        self.volume_task = None
+        self.text_channel = None
+        self.events = asyncio.Queue()  # (event, error) 音声スレッドから届く曲遷移イベント
+        self.transition_task = None
+        self.retries = 0
+        self.last_active = time.monotonic()
+
+    def get_display_volume(self):
+        return int(self.volume_level * 10)
+
+    def upcoming_urls(self, depth=PREFETCH_DEPTH):
+        if self.is_looping and self.now_playing_url:
+            return [self.now_playing_url]
+        return [entry.url for entry in self.queue.slice(0, depth)]
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def is_active(self):
+        if self.queue or self.ingest_task:
+            return True
+        return bool(self.voice_client and self.voice_client.is_connected())
+
+class Music(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.players = {}  # guild_id: GuildPlayer
+        self.extract_cache = ExtractCache()
+        self.extractor = ExtractorPool()
+        self.apple_music = AppleMusicResolver()
+        self.search_cache = SearchCache()
+        self.audio_cache = AudioCache()
+        self.metadata = MetadataCache()
+        self.metadata_jobs = asyncio.Queue()  # 曲情報を取得するURL
+        self.metadata_waiters = {}  # key: [(GuildPlayer, QueueEntry)] 取得待ちのエントリ
+        self.metadata_workers = []
 
         if not hasattr(self.bot, "current_running_cog"):
             self.bot.current_running_cog = None
 
-    def get_display_volume(self):
-        return int(self.volume_level * 10)
+        self.player_janitor.start()
+        self.cache_flusher.start()
+
+    async def cog_unload(self):
+        self.player_janitor.cancel()
+        self.cache_flusher.cancel()
+        for worker in self.metadata_workers:
+            worker.cancel()
+        self.extractor.shutdown()
+        await self.audio_cache.flush()
+        await self.search_cache.flush()
+        await self.apple_music.flush()
+        await self.apple_music.close()
+
+    def get_player(self, guild):
+        player = self.players.get(guild.id)
+        if player is None:
+            player = GuildPlayer(guild.id)
+            player.embed_updater = EmbedUpdater(self.render_now_playing_embed)
+            self.players[guild.id] = player
+        player.touch()
+        return player
+
+    def release_running_cog(self):
+        # 他のギルドでまだ再生中なら Music の占有は解除しない
+        if any(p.is_active() for p in self.players.values()):
+            return
+        if self.bot.current_running_cog == "Music":
+            self.bot.current_running_cog = None
+
+    async def remove_player(self, guild_id):
+        player = self.players.pop(guild_id, None)
+        if player:
+            player.embed_updater.cancel()
+            self.post_event(player, "stop")
+        if player and player.current_embed_message:
+            try:
+                await player.current_embed_message.delete()
+            except discord.NotFound:
+                pass
+            except Exception as e:
+                print(f"[Music.remove_player] 埋め込み削除失敗: {e}")
+            player.current_embed_message = None
+        self.release_running_cog()
+
+    @tasks.loop(seconds=60)
+    async def player_janitor(self):
+        now = time.monotonic()
+        for guild_id, player in list(self.players.items()):
+            if player.is_active():
+                player.touch()
+                continue
+            if now - player.last_active >= PLAYER_IDLE_TIMEOUT:
+                await self.remove_player(guild_id)
+
+    @player_janitor.before_loop
+    async def before_player_janitor(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=CACHE_FLUSH_INTERVAL)
+    async def cache_flusher(self):
+        try:
+            await self.search_cache.flush()
+            await self.audio_cache.flush()
+            await self.apple_music.flush()
+        except Exception as e:
+            print(f"[Music.cache_flusher] 保存失敗: {e}")
 
     async def ensure_no_conflict(self, interaction):
         if self.bot.current_running_cog and self.bot.current_running_cog != "Music":
@@ -130,143 +1285,531 @@ class Music(commands.Cog):
         self.bot.current_running_cog = "Music"
         return True
 
-    async def extract_info_async(self, url):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._extract_info, url)
+    async def extract_info_async(self, url, priority=PRIORITY_NOW_PLAYING, key=None):
+        return await self.extractor.extract(url, MUSIC_YDL_OPTS, priority=priority, key=key)
 
-    def _extract_info(self, url):
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'noplaylist': True,
-            'quiet': True,
-            'default_search': 'ytsearch'
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            return ydl.extract_info(url, download=False)
+    async def search_youtube_url(self, keyword, priority=PRIORITY_NOW_PLAYING):
+        """
+        キーワードでYouTube検索し、最初の動画のURLを返す。
+        検索キャッシュにあれば通信せずに返し、古い結果は裏で更新する。
+        """
+        query = normalize_search_query(keyword)
+        cached = self.search_cache.get(query)
+        if cached:
+            video_id, stale = cached
+            if stale and query not in self.search_cache.refreshing:
+                self.search_cache.refreshing.add(query)
+                asyncio.create_task(self.refresh_search(query, keyword))
+            return f"https://www.youtube.com/watch?v={video_id}"
+        youtube_url = await self._search_youtube(keyword, priority)
+        video_id = extract_video_id(youtube_url) if youtube_url else None
+        if video_id:
+            self.search_cache.put(query, video_id)
+        return youtube_url
+
+    async def refresh_search(self, query, keyword):
+        try:
+            youtube_url = await self._search_youtube(keyword, PRIORITY_PREFETCH)
+            video_id = extract_video_id(youtube_url) if youtube_url else None
+            if video_id:
+                self.search_cache.put(query, video_id)
+        except Exception as e:
+            print(f"[Music.refresh_search] 検索キャッシュ更新失敗: {e}")
+        finally:
+            self.search_cache.refreshing.discard(query)
+
+    async def _search_youtube(self, keyword, priority):
+        info = await self.extractor.extract(keyword, SEARCH_YDL_OPTS, priority=priority)
+        entries = info.get('entries') or []
+        if entries:
+            entry_url = playlist_entry_url(entries[0])
+            if entry_url:
+                # 検索結果のflatエントリにはタイトルと長さが入っているのでキュー表示用に覚えておく
+                self.metadata.put(extract_video_id(entry_url) or entry_url, TrackMetadata.from_entry(entries[0]))
+                return entry_url
+        return info.get('webpage_url')
+
+    async def resolve_track(self, url, priority=PRIORITY_NOW_PLAYING):
+        video_id = extract_video_id(url)
+
+        async def load(priority=priority):
+            info = await self.extract_info_async(url, priority=priority, key=video_id)
+            return ResolvedTrack.from_info(url, info)
+
+        def escalate(new_priority):
+            self.extractor.raise_priority(video_id, new_priority)
+
+        if video_id is None:
+            # 検索キーワードなどIDが分からない入力はキャッシュせずに解決
+            track = await load()
+        else:
+            track = await self.audio_cache.lookup(video_id, url)
+            if track is None:
+                track = await self.extract_cache.get_or_load(video_id, load, priority, escalate)
+        self.metadata.put(video_id or url, TrackMetadata.from_track(track))
+        return track
+
+    def enqueue(self, player, url, user, metadata=None):
+        """
+        キューに積み、表示用の曲情報が無ければ裏で補完する
+        """
+        entry = player.queue.append(url, user)
+        if metadata is not None:
+            self.metadata.put(entry.key, metadata)
+        self.enrich(player, entry)
+        return entry
+
+    def enrich(self, player, entry):
+        cached = self.metadata.get(entry.key)
+        if cached is not None and cached.title:
+            player.queue.set_metadata(entry, cached)
+            return
+        waiters = self.metadata_waiters.get(entry.key)
+        if waiters is not None:
+            # 同じ曲の取得がすでに待ち行列にある
+            waiters.append((player, entry))
+            return
+        self.metadata_waiters[entry.key] = [(player, entry)]
+        self.metadata_jobs.put_nowait(entry.url)
+        if not self.metadata_workers:
+            self.metadata_workers = [
+                asyncio.create_task(self.metadata_worker()) for _ in range(METADATA_WORKERS)
+            ]
+
+    async def metadata_worker(self):
+        """
+        キューの曲の情報を METADATA_WORKERS 件ずつ取得する。
+        単体動画はflat抽出でも通常の解決と同じ通信になるので resolve_track を使い、
+        結果を再生時の解決キャッシュとも共有する。
+        """
+        while True:
+            url = await self.metadata_jobs.get()
+            key = extract_video_id(url) or url
+            waiters = self.metadata_waiters.get(key, [])
+            if any(player.queue.get(entry.id) is entry for player, entry in waiters):
+                try:
+                    await self.resolve_track(url, priority=PRIORITY_METADATA)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[Music.metadata_worker] 曲情報の取得失敗: {url} ({e})")
+            metadata = self.metadata.get(key)
+            for player, entry in self.metadata_waiters.pop(key, []):
+                if metadata is not None and player.queue.set_metadata(entry, metadata) and player.text_channel:
+                    self.request_embed_update(player.text_channel)
+
+    def format_remaining(self, player):
+        seconds, unknown = self.remaining_time(player)
+        text = format_timestamp(seconds)
+        if unknown:
+            text += f"＋不明{unknown}曲"
+        return text
+
+    def remaining_time(self, player):
+        """
+        (再生中の曲の残り＋キューの合計秒数, 長さが分からない曲数)
+        """
+        seconds = max(0.0, player.queue.total_duration)
+        track = player.current_track
+        if track and track.duration and player.current_source:
+            seconds += max(0.0, track.duration - player.current_source.position)
+        return seconds, player.queue.unknown_durations
+
+    def _has_fresh_track(self, player, url):
+        track = player.prefetched.get(url)
+        if track is None and player.current_track and player.current_track.url == url:
+            # ループ再生中は再生中の解決結果をそのまま使い回す
+            track = player.current_track
+        return track is not None and track.is_fresh()
+
+    def schedule_prefetch(self, player):
+        if player.prefetch_task and not player.prefetch_task.done():
+            return
+        player.prefetch_task = asyncio.create_task(self.prefetch_upcoming(player))
+
+    async def prefetch_upcoming(self, player):
+        """
+        再生中に次のPREFETCH_DEPTH曲を解決しておき、曲間の待ち時間をなくす
+        """
+        try:
+            while True:
+                targets = player.upcoming_urls()
+                # キューから外れた先読み結果は破棄
+                for url in list(player.prefetched):
+                    if url not in targets:
+                        del player.prefetched[url]
+                pending = [
+                    url for url in targets
+                    if not self._has_fresh_track(player, url)
+                ]
+                if not pending:
+                    return
+                url = pending[0]
+                try:
+                    player.prefetched[url] = await self.resolve_track(url, priority=PRIORITY_PREFETCH)
+                except Exception as e:
+                    # 失敗した曲は再生時に通常どおり解決し直す
+                    print(f"[Music.prefetch] 先読み失敗: {url} ({e})")
+                    return
+        except asyncio.CancelledError:
+            pass
 
     async def update_now_playing_embed(self, channel):
-        if not self.now_playing:
+        player = self.players.get(channel.guild.id)
+        if player:
+            await player.embed_updater.flush(channel)
+
+    def request_embed_update(self, channel):
+        player = self.players.get(channel.guild.id)
+        if player:
+            player.embed_updater.request(channel)
+
+    async def render_now_playing_embed(self, channel):
+        player = self.players.get(channel.guild.id)
+        if not player or not player.now_playing:
             return
 
         embed = discord.Embed(
             title="🎵 再生中",
-            description=f"[{self.now_playing}]({self.now_playing_url})",
+            description=f"[{player.now_playing}]({player.now_playing_url})",
             color=discord.Color.green()
         )
-        if self.now_playing_requester:
-            embed.add_field(name="リクエスト者", value=self.now_playing_requester.mention, inline=False)
+        if player.now_playing_requester:
+            embed.add_field(name="リクエスト者", value=player.now_playing_requester.mention, inline=False)
         else:
             embed.add_field(name="リクエスト者", value="不明", inline=False)
-        embed.add_field(name="🔊 音量", value=f"{self.get_display_volume()}/10", inline=False)
-        embed.add_field(name="🔁 ループ", value="有効" if self.is_looping else "無効", inline=True)
-        embed.add_field(name="📜 キュー数", value=f"{len(self.queue)}曲", inline=True)
+        embed.add_field(name="🔊 音量", value=f"{player.get_display_volume()}/10", inline=False)
+        embed.add_field(name="🔁 ループ", value="有効" if player.is_looping else "無効", inline=True)
+        queue_value = f"{len(player.queue)}曲"
+        if player.queue:
+            queue_value += f"（残り{self.format_remaining(player)}）"
+        embed.add_field(name="📜 キュー数", value=queue_value, inline=True)
+        head = player.queue.slice(0, 1)
+        if head:
+            embed.add_field(name="⏭️ 次の曲", value=format_queue_title(head[0]), inline=False)
+        if player.current_track and player.current_track.thumbnail:
+            embed.set_thumbnail(url=player.current_track.thumbnail)
 
-        if self.current_embed_message:
+        if player.current_embed_message:
             try:
-                await self.current_embed_message.edit(embed=embed)
+                await player.current_embed_message.edit(embed=embed)
             except discord.NotFound:
-                self.current_embed_message = await channel.send(embed=embed, view=self.PlayerControls(channel, self))
+                player.current_embed_message = await channel.send(embed=embed, view=self.PlayerControls(channel, self))
         else:
-            self.current_embed_message = await channel.send(embed=embed, view=self.PlayerControls(channel, self))
-
-    async def play_next(self, channel):
-        if not self.queue and not self.is_looping:
-            if self.voice_client:
-                await self.voice_client.disconnect()
-                self.voice_client = None
-            if self.current_embed_message:
-                try:
-                    await self.current_embed_message.delete()
-                except discord.NotFound:
-                    pass
-                self.current_embed_message = None
-            self.bot.current_running_cog = None
+            player.current_embed_message = await channel.send(embed=embed, view=self.PlayerControls(channel, self))
+
+    def create_source(self, track, volume, position=0.0):
+        return TrackedSource(self.create_ffmpeg_source(track, volume, position), start=position)
+
+    def create_ffmpeg_source(self, track, volume, position=0.0):
+        """
+        TrackedSource に包む前のffmpeg音源。差し替え用に単体で作るときはこちらを使う
+        （一時的な TrackedSource が破棄されると AudioSource.__del__ で中身のffmpegまで止まるため）
+        """
+        # ローカルファイルには再接続オプションは不要
+        before_options = "" if track.is_local else FFMPEG_RECONNECT_OPTIONS
+        if position > 0:
+            before_options = f"-ss {position:.2f} {before_options}".strip()
+        if not OPUS_OUTPUT:
+            source = discord.FFmpegPCMAudio(
+                track.stream_url,
+                executable=config.FFMPEG_PATH,
+                before_options=before_options,
+                options="-vn"
+            )
+            return discord.PCMVolumeTransformer(source, volume=volume)
+        if track.acodec == 'opus' and abs(volume - 1.0) < 1e-6:
+            # 元がOpusで音量100%ならトランスコードせずそのまま転送
+            source = discord.FFmpegOpusAudio(
+                track.stream_url,
+                codec='copy',
+                executable=config.FFMPEG_PATH,
+                before_options=before_options,
+                options="-vn"
+            )
+        else:
+            source = discord.FFmpegOpusAudio(
+                track.stream_url,
+                bitrate=OPUS_BITRATE,
+                executable=config.FFMPEG_PATH,
+                before_options=before_options,
+                options=f"-vn -filter:a volume={volume:.2f}"
+            )
+        return source
+
+    def change_volume(self, player, delta):
+        player.volume_level = min(1.0, max(0.0, round(player.volume_level + delta, 1)))
+        vc = player.voice_client
+        source = vc.source if vc else None
+        if not isinstance(source, TrackedSource):
+            return
+        if not OPUS_OUTPUT:
+            source.inner.volume = player.volume_level
+            return
+        if player.volume_task and not player.volume_task.done():
+            player.volume_task.cancel()
+        player.volume_task = asyncio.create_task(self.restart_with_volume(player, source))
+
+    async def restart_with_volume(self, player, tracked):
+        """
+        新しい音量のffmpegを現在位置から起動し、追いついた時点で差し替える
+        """
+        try:
+            await asyncio.sleep(VOLUME_RESTART_DELAY)
+        except asyncio.CancelledError:
+            return
+        track = player.current_track
+        if track is None or tracked.closed:
+            return
+        start = tracked.position
+        try:
+            new_source = self.create_ffmpeg_source(track, player.volume_level, position=start)
+        except Exception as e:
+            print(f"[Music.restart_with_volume] 音源作成失敗: {e}")
+            return
+        try:
+            position, first_frame = await asyncio.to_thread(prime_source, new_source, start, tracked)
+        except asyncio.CancelledError:
+            new_source.cleanup()
             return
+        except Exception as e:
+            print(f"[Music.restart_with_volume] 音源切り替え失敗: {e}")
+            new_source.cleanup()
+            return
+        if not first_frame:
+            # 新しい音源が何も返さなかったので今の音源を使い続ける
+            new_source.cleanup()
+            return
+        tracked.replace(new_source, position, first_frame)
 
-        if not self.voice_client or not self.voice_client.is_connected():
+    async def seek(self, player, position):
+        """
+        再生中の曲を position 秒から再生し直す。ffmpegを -ss 付きで開き直して音源を差し替えるので、
+        曲の頭から読み直したり再生を止めたりしない。成功したらTrue
+        """
+        tracked = player.current_source
+        track = player.current_track
+        if tracked is None or tracked.closed or track is None:
+            return False
+        # 保留中の音量変更は古い位置で張り替えてしまうので取り消す（音量は新しい音源に反映される）
+        if player.volume_task and not player.volume_task.done():
+            player.volume_task.cancel()
+        if not track.is_fresh():
+            track = await self.resolve_track(track.url)
+            player.current_track = track
+        new_source = self.create_ffmpeg_source(track, player.volume_level, position=position)
+        try:
+            first_frame = await asyncio.to_thread(new_source.read)
+        except Exception as e:
+            print(f"[Music.seek] 音源切り替え失敗: {e}")
+            new_source.cleanup()
+            return False
+        if not first_frame or player.current_source is not tracked:
+            new_source.cleanup()
+            return False
+        tracked.replace(new_source, position, first_frame)
+        return True
+
+    def find_fallback_voice_channel(self, guild, player):
+        """
+        VC切断後に再接続する先。次の曲（または再生中の曲）のリクエスト者の居場所を優先する
+        """
+        head = player.queue.slice(0, 1)
+        requester = head[0].user if head else player.now_playing_requester
+        if requester:
+            voice_channel = find_user_voice_channel(self.bot, guild, requester)
+            if voice_channel:
+                return voice_channel
+        index = self.bot.get_cog("VoiceStateIndex")
+        if index:
+            return index.occupied_channel(guild)
+        return None
+
+    def post_event(self, player, event, error=None):
+        """
+        曲遷移イベントを送る。音声スレッドからも呼べる
+        """
+        try:
+            self.bot.loop.call_soon_threadsafe(player.events.put_nowait, (event, error))
+        except RuntimeError:
+            # ループ終了後（Bot停止中）は捨てる
+            pass
+
+    def ensure_transitions(self, player):
+        if player.transition_task is None or player.transition_task.done():
+            player.transition_task = asyncio.create_task(self.run_transitions(player))
+
+    def interrupted_position(self, player):
+        """
+        再生中の音源が曲の途中で終わっていればその位置（秒）を返す。
+        最後まで再生した・スキップされた・長さが分からない場合は0
+        """
+        source = player.current_source
+        track = player.current_track
+        if player.skip_requested or source is None or track is None or not track.duration:
+            return 0.0
+        if track.duration - source.position <= RESUME_MIN_REMAINING:
+            return 0.0
+        return source.position
+
+    async def run_transitions(self, player):
+        """
+        プレイヤーごとの曲遷移タスク。音声スレッドはイベントを渡すだけで、
+        次の曲・ループ・停止・失敗時の再試行はすべてここで順番に判断する。
+        ストリームURLの期限切れやffmpegの異常終了で曲の途中で止まった場合は、
+        解決し直して止まった位置から再開する。
+        """
+        while True:
+            event, error = await player.events.get()
+            if event == "stop" or self.players.get(player.guild_id) is not player:
+                return
+            replay = False
+            position = 0.0
+            if event == "failed":
+                # 再開のための解決に失敗した場合も、再試行するなら同じ位置から
+                position = player.resume_position or 0.0
+            elif event == "finished":
+                position = self.interrupted_position(player)
+            if error is not None or position > 0:
+                if error is not None:
+                    print(f"[Music.run_transitions] 再生エラー({event}): {error}")
+                else:
+                    print(f"[Music.run_transitions] 曲の途中で音源が終了: {format_timestamp(position)}")
+                if player.resume_position is not None and position - player.resume_position >= RESUME_PROGRESS_SECONDS:
+                    # 前回の再開から十分進んでいれば別の中断として数え直す
+                    player.retries = 0
+                if player.retries < TRANSITION_MAX_RETRIES and player.now_playing_url:
+                    player.retries += 1
+                    replay = True
+                    player.resume_position = position
+                    track = player.current_track
+                    video_id = extract_video_id(player.now_playing_url)
+                    if video_id and (error is not None or track is None or not track.is_fresh()):
+                        # 期限切れURLなどを疑い、キャッシュを捨てて解決し直す
+                        self.extract_cache.invalidate(video_id)
+                        # ローカルキャッシュから再生していた場合は次回使う前に中身を確かめ直す
+                        self.audio_cache.verified.discard(video_id)
+                else:
+                    player.retries = 0
+            elif event == "finished":
+                player.retries = 0
+            try:
+                await self.play_next(player.text_channel, replay=replay)
+            except Exception as e:
+                print(f"[Music.run_transitions] 曲の切り替え失敗: {e}")
+
+    async def play_next(self, channel, replay=False):
+        player = self.get_player(channel.guild)
+        player.text_channel = channel
+        if not player.queue and not player.is_looping and not replay:
+            if player.ingest_task:
+                # プレイリストの続きが届いたら再開する
+                player.waiting_for_ingest = True
+                return
+            if player.voice_client:
+                await player.voice_client.disconnect()
+                player.voice_client = None
+            await self.remove_player(channel.guild.id)
+            return
+
+        if not player.voice_client or not player.voice_client.is_connected():
             if channel.guild.voice_client:
-                self.voice_client = channel.guild.voice_client
+                player.voice_client = channel.guild.voice_client
             else:
-                voice_channel = None
-                for member in channel.guild.members:
-                    if member.voice and member.voice.channel:
-                        voice_channel = member.voice.channel
-                        break
+                voice_channel = self.find_fallback_voice_channel(channel.guild, player)
                 if voice_channel:
-                    self.voice_client = await voice_channel.connect()
+                    player.voice_client = await voice_channel.connect()
                 else:
                     await channel.send("接続中のボイスチャンネルが見つかりません。")
-                    self.bot.current_running_cog = None
+                    player.queue.clear()
+                    self.release_running_cog()
                     return
 
-        if self.voice_client.is_playing():
+        if player.voice_client.is_playing() or player.voice_client.is_paused():
             return
 
-        if self.is_looping and self.now_playing_url and self.now_playing_requester:
-            url = self.now_playing_url
-            user = self.now_playing_requester
+        index = self.bot.get_cog("VoiceStateIndex")
+        if index and index.is_empty(channel.guild.id, player.voice_client.channel.id):
+            await channel.send("ボイスチャンネルに誰もいないため再生を終了しました。")
+            await self.stop_player(player)
+            return
+
+        if replay and player.now_playing_url:
+            url = player.now_playing_url
+            user = player.now_playing_requester
+            track = None
+        elif player.is_looping and player.now_playing_url and player.now_playing_requester:
+            url = player.now_playing_url
+            user = player.now_playing_requester
+            track = player.current_track
         else:
-            url, user = self.queue.popleft()
-            self.now_playing_url = url
-            self.now_playing_requester = user
-        self.is_paused = False
+            entry = player.queue.popleft()
+            url, user = entry.url, entry.user
+            player.now_playing_url = url
+            player.now_playing_requester = user
+            track = None
+        if not replay:
+            player.resume_position = None
+        player.skip_requested = False
+        player.is_paused = False
 
-        if self.preparing_message:
+        prefetched = player.prefetched.pop(url, None)
+        if prefetched and prefetched.is_fresh() and not replay:
+            track = prefetched
+        if track and not track.is_fresh():
+            track = None
+
+        if player.preparing_message:
             try:
-                await self.preparing_message.delete()
+                await player.preparing_message.delete()
             except discord.NotFound:
                 pass
             except Exception as e:
                 print(f"[preparing_message.delete] 予期しないエラー: {e}")
-            self.preparing_message = None
-        self.preparing_message = await channel.send("再生準備中...")
+            player.preparing_message = None
 
-        try:
-            info = await self.extract_info_async(url)
-            title = info.get('title', 'Unknown Title')
-            audio_url = info['url'] if 'url' in info else max(
-                [f for f in info.get('formats', []) if f.get('acodec') != 'none' and f.get('url')],
-                key=lambda f: f.get('abr') or 0)['url']
-        except Exception as e:
-            await channel.send(f"音源取得失敗: {str(e)}")
-            if self.preparing_message:
-                try:
-                    await self.preparing_message.delete()
-                except discord.NotFound:
-                    pass
-                except Exception as e:
-                    print(f"[preparing_message.delete] 予期しないエラー: {e}")
-                self.preparing_message = None
-                self.bot.current_running_cog = None
-            return
+        if track is None:
+            player.preparing_message = await channel.send("再生準備中...")
+            try:
+                track = await self.resolve_track(url)
+            except Exception as e:
+                await channel.send(f"音源取得失敗: {str(e)}")
+                if player.preparing_message:
+                    try:
+                        await player.preparing_message.delete()
+                    except discord.NotFound:
+                        pass
+                    except Exception as delete_error:
+                        print(f"[preparing_message.delete] 予期しないエラー: {delete_error}")
+                    player.preparing_message = None
+                # 再試行するか次の曲へ進むかは遷移タスクが決める
+                self.post_event(player, "failed", e)
+                return
 
-        self.now_playing = title
+        player.current_track = track
+        player.now_playing = track.title
 
-        source = discord.FFmpegPCMAudio(
-            audio_url,
-            executable=config.FFMPEG_PATH,
-            before_options="-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
-            options="-vn"
-        )
+        position = (player.resume_position or 0.0) if replay else 0.0
+        source = self.create_source(track, player.volume_level, position=position)
+        player.current_source = source
 
         def after_play(error):
-            coro = self.play_next(channel)
-            fut = asyncio.run_coroutine_threadsafe(coro, self.bot.loop)
-            try:
-                fut.result()
-            except Exception as e:
-                print(f"Error in after_play: {e}")
+            # 音声スレッドから呼ばれる。ここでは何も待たずにイベントを渡すだけ
+            self.post_event(player, "finished", error)
 
-        self.voice_client.play(
-            discord.PCMVolumeTransformer(source, volume=self.volume_level),
-            after=after_play
-        )
+        player.voice_client.play(source, after=after_play)
+
+        if not replay and self.audio_cache.record_play(track):
+            asyncio.create_task(self.audio_cache.store(track))
+
+        self.schedule_prefetch(player)
 
-        if self.preparing_message:
+        if player.preparing_message:
             try:
-                await self.preparing_message.delete()
+                await player.preparing_message.delete()
             except discord.NotFound:
                 pass
+            player.preparing_message = None
 
         await self.update_now_playing_embed(channel)
 
@@ -276,43 +1819,197 @@ class Music(commands.Cog):
         if not conflict:
             return
 
-        if not interaction.user.voice or not interaction.user.voice.channel:
+        voice_channel = find_user_voice_channel(self.bot, interaction.guild, interaction.user)
+        if not voice_channel:
             await interaction.response.send_message("VCに参加してから実行してください。", ephemeral=True)
+            self.release_running_cog()
             return
 
         await interaction.response.defer(ephemeral=True)  # ここで1回だけ
 
+        player = self.get_player(interaction.guild)
+
         # 以降は followup.send を使う
         if is_youtube_playlist_url(url):
-            video_urls = extract_youtube_playlist_video_urls(url)
-            if not video_urls:
+            entries = stream_youtube_playlist_entries(url)
+            first_url = None
+            first_metadata = None
+            duplicates = 0
+            try:
+                async for entry in entries:
+                    entry_url = playlist_entry_url(entry)
+                    if not entry_url:
+                        continue
+                    if player.queue.contains_url(entry_url):
+                        duplicates += 1
+                    first_url = entry_url
+                    first_metadata = TrackMetadata.from_entry(entry)
+                    break
+            except Exception:
+                first_url = None
+            if not first_url:
+                await entries.aclose()
                 await interaction.followup.send("プレイリストの動画取得に失敗しました。", ephemeral=True)
+                self.release_running_cog()
                 return
-            for vurl in video_urls:
-                self.queue.append((vurl, interaction.user))
-            await interaction.followup.send(f"プレイリストから{len(video_urls)}曲をキューに追加しました。", ephemeral=True)
+            self.enqueue(player, first_url, interaction.user, first_metadata)
+            progress_message = await interaction.followup.send(
+                "プレイリストを読み込み中...（1曲追加）", ephemeral=True, wait=True
+            )
+            # 1曲目はすぐ再生し、残りはバックグラウンドで追加していく
+            player.ingest_task = asyncio.create_task(
+                self.ingest_playlist(player, interaction.channel, entries, interaction.user, progress_message, duplicates=duplicates)
+            )
         elif is_apple_music_url(url):
-            keyword = get_apple_music_title_jsonld(url) or get_apple_music_title_html(url)
-            if not keyword:
-                await interaction.followup.send("Apple Musicの曲情報取得に失敗しました。", ephemeral=True)
-                return
-            youtube_url = get_youtube_url_by_keyword(keyword)
+            youtube_url = self.apple_music.lookup(url)
             if not youtube_url:
-                await interaction.followup.send("YouTubeで該当曲が見つかりませんでした。", ephemeral=True)
-                return
-            self.queue.append((youtube_url, interaction.user))
-            await interaction.followup.send(f"キューに追加しました（{len(self.queue)}曲）", ephemeral=True)
+                keyword = await self.apple_music.fetch_keyword(url)
+                if not keyword:
+                    await interaction.followup.send("Apple Musicの曲情報取得に失敗しました。", ephemeral=True)
+                    self.release_running_cog()
+                    return
+                try:
+                    youtube_url = await self.search_youtube_url(keyword)
+                except Exception as e:
+                    print(f"[Music.search_youtube_url] 検索失敗: {e}")
+                    youtube_url = None
+                if not youtube_url:
+                    await interaction.followup.send("YouTubeで該当曲が見つかりませんでした。", ephemeral=True)
+                    self.release_running_cog()
+                    return
+                self.apple_music.remember(url, youtube_url)
+            await self.enqueue_single(interaction, player, youtube_url)
         else:
-            self.queue.append((url, interaction.user))
-            await interaction.followup.send(f"キューに追加しました（{len(self.queue)}曲）", ephemeral=True)
+            if not is_url(url):
+                # キーワードは検索キャッシュ経由で動画URLにしてから積む
+                try:
+                    youtube_url = await self.search_youtube_url(url)
+                except Exception as e:
+                    print(f"[Music.search_youtube_url] 検索失敗: {e}")
+                    youtube_url = None
+                if not youtube_url:
+                    await interaction.followup.send("YouTubeで該当曲が見つかりませんでした。", ephemeral=True)
+                    self.release_running_cog()
+                    return
+                url = youtube_url
+            await self.enqueue_single(interaction, player, url)
 
-        if not self.voice_client:
-            self.voice_client = await interaction.user.voice.channel.connect()
+        if not player.voice_client:
+            player.voice_client = await voice_channel.connect()
         else:
-            if self.voice_client.channel != interaction.user.voice.channel:
-                await self.voice_client.move_to(interaction.user.voice.channel)
+            if player.voice_client.channel != voice_channel:
+                await player.voice_client.move_to(voice_channel)
+
+        player.text_channel = interaction.channel
+        self.ensure_transitions(player)
+        self.post_event(player, "start")
+        self.schedule_prefetch(player)
 
-        await self.play_next(interaction.channel)
+    async def enqueue_single(self, interaction, player, url):
+        # 同じ曲も積めるようにし、重複していることだけ知らせる
+        note = "（同じ曲がすでにキューにあります）" if player.queue.contains_url(url) else ""
+        self.enqueue(player, url, interaction.user)
+        await interaction.followup.send(f"キューに追加しました（{len(player.queue)}曲）{note}", ephemeral=True)
+
+    async def ingest_playlist(self, player, channel, entries, user, progress_message, added=1, duplicates=0):
+        last_report = time.monotonic()
+        failed = False
+        try:
+            async for entry in entries:
+                if self.players.get(player.guild_id) is not player:
+                    # 停止・破棄されたプレイヤーには追加しない
+                    return
+                entry_url = playlist_entry_url(entry)
+                if not entry_url:
+                    continue
+                if player.queue.contains_url(entry_url):
+                    duplicates += 1
+                self.enqueue(player, entry_url, user, TrackMetadata.from_entry(entry))
+                added += 1
+                if player.waiting_for_ingest:
+                    player.waiting_for_ingest = False
+                    self.post_event(player, "start")
+                if added <= PREFETCH_DEPTH + 1:
+                    self.schedule_prefetch(player)
+                if time.monotonic() - last_report >= PLAYLIST_PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await self._edit_progress(progress_message, f"プレイリストを読み込み中...（{added}曲追加）")
+                    self.request_embed_update(channel)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            print(f"[Music.ingest_playlist] 読み込み中断: {e}")
+            failed = True
+        finally:
+            await entries.aclose()
+            player.ingest_task = None
+            if player.waiting_for_ingest and self.players.get(player.guild_id) is player:
+                # 続きが無かったので通常の終了処理に任せる
+                player.waiting_for_ingest = False
+                self.post_event(player, "start")
+        note = f"（うち{duplicates}曲はキューにある曲と重複）" if duplicates else ""
+        if failed:
+            await self._edit_progress(progress_message, f"プレイリストの読み込みが途中で失敗しました（{added}曲追加）{note}")
+        else:
+            await self._edit_progress(progress_message, f"プレイリストから{added}曲をキューに追加しました。{note}")
+
+    async def _edit_progress(self, message, content):
+        try:
+            await message.edit(content=content)
+        except Exception as e:
+            print(f"[Music.ingest_playlist] 進捗メッセージ更新失敗: {e}")
+
+    @app_commands.command(name="music_remove", description="キューから曲を削除（番号はキュー表示の#番号）")
+    @app_commands.describe(entry_id="削除する曲の#番号")
+    async def music_remove(self, interaction: discord.Interaction, entry_id: int):
+        player = self.players.get(interaction.guild.id)
+        entry = player.queue.remove(entry_id) if player else None
+        if entry is None:
+            await interaction.response.send_message(f"#{entry_id} はキューにありません。", ephemeral=True)
+            return
+        player.prefetched.pop(entry.url, None)
+        await interaction.response.send_message(f"#{entry.id} をキューから削除しました。", ephemeral=True)
+        self.request_embed_update(interaction.channel)
+        self.schedule_prefetch(player)
+
+    @app_commands.command(name="music_playnext", description="キューの曲を次に再生（番号はキュー表示の#番号）")
+    @app_commands.describe(entry_id="次に再生する曲の#番号")
+    async def music_playnext(self, interaction: discord.Interaction, entry_id: int):
+        player = self.players.get(interaction.guild.id)
+        if not player or not player.queue.move_to_front(entry_id):
+            await interaction.response.send_message(f"#{entry_id} はキューにありません。", ephemeral=True)
+            return
+        await interaction.response.send_message(f"#{entry_id} を次に再生します。", ephemeral=True)
+        self.request_embed_update(interaction.channel)
+        self.schedule_prefetch(player)
+
+    @app_commands.command(name="seek", description="再生中の曲の再生位置を移動（例: 90 / 1:30）")
+    @app_commands.describe(position="移動先の位置（秒 または 分:秒）")
+    async def seek_command(self, interaction: discord.Interaction, position: str):
+        player = self.players.get(interaction.guild.id)
+        if not player or not player.voice_client or not player.current_track or not player.current_source:
+            await interaction.response.send_message("再生中の曲がありません。", ephemeral=True)
+            return
+        seconds = parse_timestamp(position)
+        if seconds is None:
+            await interaction.response.send_message("位置は 90 や 1:30 の形式で指定してください。", ephemeral=True)
+            return
+        duration = player.current_track.duration
+        if duration and seconds >= duration:
+            await interaction.response.send_message(
+                f"曲の長さ（{format_timestamp(duration)}）を超えています。", ephemeral=True
+            )
+            return
+        await interaction.response.defer(ephemeral=True)
+        try:
+            moved = await self.seek(player, seconds)
+        except Exception as e:
+            print(f"[Music.seek] シーク失敗: {e}")
+            moved = False
+        if moved:
+            await interaction.followup.send(f"{format_timestamp(seconds)} に移動しました。", ephemeral=True)
+        else:
+            await interaction.followup.send("再生位置の移動に失敗しました。", ephemeral=True)
 
     class PlayerControls(discord.ui.View):
         def __init__(self, channel, cog, queue_page=0):
@@ -323,9 +2020,13 @@ class Music(commands.Cog):
 
         PAGE_SIZE = 20
 
+        @property
+        def player(self):
+            return self.cog.get_player(self.channel.guild)
+
         @discord.ui.button(label="⏸️ / ▶️", style=discord.ButtonStyle.blurple)
         async def toggle_pause(self, interaction: discord.Interaction, button: discord.ui.Button):
-            vc = self.cog.voice_client
+            vc = self.player.voice_client
             if not vc:
                 await interaction.response.send_message("ボイスチャンネルに接続していません。", ephemeral=True)
                 return
@@ -337,26 +2038,25 @@ class Music(commands.Cog):
 
         @discord.ui.button(label="🔉 音量－", style=discord.ButtonStyle.gray)
         async def volume_down(self, interaction: discord.Interaction, button: discord.ui.Button):
-            self.cog.volume_level = max(0.0, self.cog.volume_level - 0.1)
-            if self.cog.voice_client and self.cog.voice_client.source:
-                self.cog.voice_client.source.volume = self.cog.volume_level
-            await self.cog.update_now_playing_embed(self.channel)
+            self.cog.change_volume(self.player, -0.1)
+            self.cog.request_embed_update(self.channel)
             await interaction.response.defer()
 
         @discord.ui.button(label="🔊 音量＋", style=discord.ButtonStyle.gray)
         async def volume_up(self, interaction: discord.Interaction, button: discord.ui.Button):
-            self.cog.volume_level = min(1.0, self.cog.volume_level + 0.1)
-            if self.cog.voice_client and self.cog.voice_client.source:
-                self.cog.voice_client.source.volume = self.cog.volume_level
-            await self.cog.update_now_playing_embed(self.channel)
+            self.cog.change_volume(self.player, 0.1)
+            self.cog.request_embed_update(self.channel)
             await interaction.response.defer()
 
         @discord.ui.button(label="⏭️ スキップ", style=discord.ButtonStyle.green)
         async def skip(self, interaction: discord.Interaction, button: discord.ui.Button):
-            vc = self.cog.voice_client
+            player = self.player
+            vc = player.voice_client
             if vc and vc.is_playing():
+                # 途中終了による再開と区別する
+                player.skip_requested = True
                 vc.stop()
-            await self.cog.update_now_playing_embed(self.channel)
+            self.cog.request_embed_update(self.channel)
             await interaction.response.defer()
 
         @discord.ui.button(label="📜 キュー表示", style=discord.ButtonStyle.green)
@@ -364,7 +2064,7 @@ class Music(commands.Cog):
             await self.send_queue_page(interaction, 0)
 
         async def send_queue_page(self, interaction, page):
-            queue = list(self.cog.queue)
+            queue = self.player.queue
             total = len(queue)
             if total == 0:
                 if interaction.response.is_done():
@@ -377,8 +2077,14 @@ class Music(commands.Cog):
             page = max(0, min(page, max_page))
             start = page * self.PAGE_SIZE
             end = start + self.PAGE_SIZE
-            msg = "\n".join(f"{i+1}. {url}" for i, (url, user) in enumerate(queue[start:end], start=start))
-            content = f"再生待ちキュー（{page+1}/{max_page+1}ページ）：\n{msg}"
+            msg = "\n".join(
+                f"{i+1}. [#{entry.id}] {format_queue_title(entry)}"
+                for i, entry in enumerate(queue.slice(start, end), start=start)
+            )
+            content = (
+                f"再生待ちキュー（{page+1}/{max_page+1}ページ・あなたのリクエスト{queue.count_for(interaction.user)}曲・"
+                f"残り{self.cog.format_remaining(self.player)}）：\n{msg}"
+            )
 
             view = QueuePaginationView(self.channel, self.cog, page, max_page)
             if interaction.response.is_done():
@@ -389,64 +2095,68 @@ class Music(commands.Cog):
 
         @discord.ui.button(label="❌ キュークリア", style=discord.ButtonStyle.red)
         async def clear_queue(self, interaction: discord.Interaction, button: discord.ui.Button):
-            self.cog.queue.clear()
-            await self.cog.update_now_playing_embed(self.channel)
+            self.player.queue.clear()
+            self.cog.request_embed_update(self.channel)
             await interaction.response.defer()
 
         @discord.ui.button(label="⏹️ 停止", style=discord.ButtonStyle.red)
         async def stop(self, interaction: discord.Interaction, button: discord.ui.Button):
-            vc = self.cog.voice_client
-            if vc:
-                if vc.is_playing() or vc.is_paused():
-                    vc.stop()
-                try:
-                    await vc.disconnect()
-                except Exception:
-                    pass
-            self.cog.voice_client = None
-            self.cog.queue.clear()
-            if self.cog.current_embed_message:
-                try:
-                    await self.cog.current_embed_message.delete()
-                except discord.NotFound:
-                    pass
-                self.cog.current_embed_message = None
-            self.bot.current_running_cog = None
+            await self.cog.stop_all(self.channel.guild)
             await interaction.response.defer()
 
         @discord.ui.button(label="🔁 ループ", style=discord.ButtonStyle.secondary)
         async def loop(self, interaction: discord.Interaction, button: discord.ui.Button):
-            self.cog.is_looping = not self.cog.is_looping
-            await self.cog.update_now_playing_embed(self.channel)
+            player = self.player
+            player.is_looping = not player.is_looping
+            self.cog.request_embed_update(self.channel)
             await interaction.response.defer()
 
-    async def stop_all(self):
-        if self.voice_client:
+    async def stop_player(self, player):
+        # 停止で発生する再生終了イベントより先に遷移タスクを止める
+        self.post_event(player, "stop")
+        player.queue.clear()
+        player.is_looping = False
+        if player.prefetch_task and not player.prefetch_task.done():
+            player.prefetch_task.cancel()
+        player.waiting_for_ingest = False
+        if player.ingest_task and not player.ingest_task.done():
+            player.ingest_task.cancel()
+        if player.volume_task and not player.volume_task.done():
+            player.volume_task.cancel()
+        player.prefetched.clear()
+        if player.voice_client:
             # ffmpegプロセスの強制終了（必要なら）
             try:
-                if hasattr(self.voice_client, '_player') and hasattr(self.voice_client._player, '_process'):
-                    process = self.voice_client._player._process
+                if hasattr(player.voice_client, '_player') and hasattr(player.voice_client._player, '_process'):
+                    process = player.voice_client._player._process
                     if process and process.poll() is None:
                         process.kill()
             except Exception as e:
                 print(f"[Music.stop_all] ffmpeg強制終了失敗: {e}")
 
-            if self.voice_client.is_playing() or self.voice_client.is_paused():
-                self.voice_client.stop()
+            if player.voice_client.is_playing() or player.voice_client.is_paused():
+                player.voice_client.stop()
             try:
                 # タイムアウト付きで切断
-                await asyncio.wait_for(self.voice_client.disconnect(), timeout=5)
+                await asyncio.wait_for(player.voice_client.disconnect(), timeout=5)
             except Exception as e:
                 print(f"[Music.stop_all] VC切断失敗: {e}")
-            self.voice_client = None
-        self.queue.clear()
-        if self.current_embed_message:
-            try:
-                await self.current_embed_message.delete()
-            except discord.NotFound:
-                pass
-            self.current_embed_message = None
-        self.bot.current_running_cog = None
+            player.voice_client = None
+        await self.remove_player(player.guild_id)
+
+    async def stop_all(self, guild=None):
+        """
+        guild を指定するとそのギルドのみ、省略すると全ギルドの再生を停止する
+        """
+        if guild is not None:
+            player = self.players.get(guild.id)
+            if player:
+                await self.stop_player(player)
+        else:
+            for player in list(self.players.values()):
+                await self.stop_player(player)
+        self.release_running_cog()
+
 
 class QueuePaginationView(discord.ui.View):
     def __init__(self, channel, cog, page, max_page):
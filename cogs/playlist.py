@@ -7,6 +7,7 @@ import yt_dlp
 import config
 from datetime import timedelta
 import random
+from cogs.voice_state import find_user_voice_channel
 
 PLAYLIST_DIR = "playlists"
 MUSIC_DIR = "music"
@@ -42,6 +43,12 @@ class PlaylistCog(commands.Cog):
         vc = self.voice_clients.get(guild_id)
         return vc is not None and vc.is_connected()
 
+    def is_channel_empty(self, vc):
+        index = self.bot.get_cog("VoiceStateIndex")
+        if not index or not vc.channel:
+            return False
+        return index.is_empty(vc.channel.guild.id, vc.channel.id)
+
     @app_commands.command(name="playlist", description="YouTubeのURLから音楽をダウンロードしてプレイリストに追加")
     @app_commands.describe(url="YouTubeの音楽URL")
     async def playlist(self, interaction: discord.Interaction, url: str):
@@ -80,7 +87,8 @@ class PlaylistCog(commands.Cog):
         if not playlist:
             await interaction.response.send_message("プレイリストが空です。", ephemeral=True)
             return
-        if not interaction.user.voice or not interaction.user.voice.channel:
+        channel = find_user_voice_channel(self.bot, interaction.guild, interaction.user)
+        if not channel:
             await interaction.response.send_message("VCに入ってから実行してください。", ephemeral=True)
             return
 
@@ -90,7 +98,6 @@ class PlaylistCog(commands.Cog):
 
         self.bot.current_running_cog = "Playlist"
 
-        channel = interaction.user.voice.channel
         try:
             vc = await channel.connect()
             self.voice_clients[guild_id] = vc
@@ -122,6 +129,9 @@ class PlaylistCog(commands.Cog):
                 vc.play(discord.PCMVolumeTransformer(source, volume=self.volume_level))
                 while vc.is_playing() or vc.is_paused():
                     await discord.utils.sleep_until(discord.utils.utcnow() + timedelta(seconds=1))
+                if self.is_channel_empty(vc):
+                    # 誰も聴いていなければ残りは再生しない
+                    break
         except Exception as e:
             await interaction.followup.send(f"再生中にエラー: {e}", ephemeral=True)
         finally:
@@ -141,7 +151,8 @@ class PlaylistCog(commands.Cog):
         if not playlist:
             await interaction.response.send_message("プレイリストが空です。", ephemeral=True)
             return
-        if not interaction.user.voice or not interaction.user.voice.channel:
+        channel = find_user_voice_channel(self.bot, interaction.guild, interaction.user)
+        if not channel:
             await interaction.response.send_message("VCに入ってから実行してください。", ephemeral=True)
             return
 
@@ -151,7 +162,6 @@ class PlaylistCog(commands.Cog):
 
         self.bot.current_running_cog = "Playlist"
 
-        channel = interaction.user.voice.channel
         try:
             vc = await channel.connect()
             self.voice_clients[guild_id] = vc
@@ -186,6 +196,9 @@ class PlaylistCog(commands.Cog):
                 vc.play(discord.PCMVolumeTransformer(source, volume=self.volume_level))
                 while vc.is_playing() or vc.is_paused():
                     await discord.utils.sleep_until(discord.utils.utcnow() + timedelta(seconds=1))
+                if self.is_channel_empty(vc):
+                    # 誰も聴いていなければ残りは再生しない
+                    break
         except Exception as e:
             await interaction.followup.send(f"再生中にエラー: {e}", ephemeral=True)
         finally:
@@ -0,0 +1,188 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+import json
+import os
+import unicodedata
+from collections import deque
+import config
+
+READING_DICT_FILE = config.READING_DICT_PATH
+READING_DICT_MAX_ENTRIES = 300  # 1サーバーに登録できる単語数
+READING_WORD_MAX_LENGTH = 30
+READING_MAX_LENGTH = 50
+DICT_LIST_MAX_LENGTH = 1900  # 一覧表示の文字数上限（Discordの2000文字制限）
+
+def load_reading_dict():
+    if os.path.exists(READING_DICT_FILE):
+        try:
+            with open(READING_DICT_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[reading_dict] 辞書ファイル読み込みエラー: {e}")
+    return {}  # {guild_id: {単語: 読み}}
+
+def save_reading_dict(data):
+    try:
+        with open(READING_DICT_FILE, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"[reading_dict] 辞書ファイル保存エラー: {e}")
+
+def normalize_word(word: str) -> str:
+    """
+    登録・照合に使う表記（全角/半角と大文字/小文字の違いを吸収）
+    """
+    return unicodedata.normalize("NFKC", word).strip().lower()
+
+class AhoCorasick:
+    """
+    登録語をまとめて1回の走査で置き換える照合器。
+    文の長さに比例する時間で済み、登録語の数には左右されない。重なったときは左端・最長を優先する
+    """
+    def __init__(self, entries):
+        self.goto = [{}]
+        self.fail = [0]
+        self.depth = [0]
+        self.output = [None]  # そのノードで終わる最長の登録語 (長さ, 読み)
+        for word, reading in entries.items():
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.depth.append(self.depth[node] + 1)
+                    self.output.append(None)
+                    self.goto[node][ch] = nxt
+                node = nxt
+            self.output[node] = (len(word), reading)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                fail = self.fail[node]
+                while fail and ch not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[nxt] = self.goto[fail].get(ch, 0)
+                if self.output[nxt] is None:
+                    self.output[nxt] = self.output[self.fail[nxt]]
+                queue.append(nxt)
+
+    def step(self, node, ch):
+        while node and ch not in self.goto[node]:
+            node = self.fail[node]
+        return self.goto[node].get(ch, 0)
+
+    def replace(self, text: str) -> str:
+        folded = text.lower()
+        if len(folded) != len(text):
+            # 小文字にすると長さが変わる文字があるときは位置がずれるのでそのまま照合する
+            folded = text
+        parts = []
+        pos = 0  # まだ出力していない位置
+        best = None  # (開始, 終了, 読み) 今のところ左端・最長の一致
+        node = 0
+        i = 0
+        while i < len(text) or best:
+            if i < len(text):
+                node = self.step(node, folded[i])
+                found = self.output[node]
+                if found:
+                    start = i + 1 - found[0]
+                    if best is None or start < best[0] or (start == best[0] and i + 1 > best[1]):
+                        best = (start, i + 1, found[1])
+                i += 1
+                # これより前から始まる一致はもう現れないなら確定する（文末では必ず確定する）
+                if not best or best[0] >= i - self.depth[node]:
+                    continue
+            parts.append(text[pos:best[0]])
+            parts.append(best[2])
+            pos = i = best[1]
+            best = None
+            node = 0
+        parts.append(text[pos:])
+        return "".join(parts)
+
+class ReadingDictionary(commands.Cog):
+    """
+    サーバーごとの読み上げ辞書。Joinの読み上げ前の正規化から apply() で使われる
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.entries = load_reading_dict()  # {guild_id: {単語: 読み}}
+        self.matchers = {}  # guild_id: AhoCorasick（辞書を変えたら作り直す）
+
+    def apply(self, guild_id, text: str) -> str:
+        entries = self.entries.get(str(guild_id))
+        if not entries:
+            return text
+        matcher = self.matchers.get(str(guild_id))
+        if matcher is None:
+            matcher = AhoCorasick(entries)
+            self.matchers[str(guild_id)] = matcher
+        return matcher.replace(text)
+
+    def update(self, guild_id):
+        self.matchers.pop(str(guild_id), None)
+        save_reading_dict(self.entries)
+
+    @app_commands.command(name="dict_add", description="読み上げ辞書に単語の読みを登録します（上書き可）")
+    @app_commands.describe(word="読み方を変えたい単語", reading="読み（ひらがな・カタカナ推奨）")
+    @app_commands.guild_only()
+    async def dict_add(self, interaction: discord.Interaction, word: str, reading: str):
+        key = normalize_word(word)
+        reading = reading.strip()
+        if not key or not reading:
+            await interaction.response.send_message("単語と読みを入力してください。", ephemeral=True)
+            return
+        if len(key) > READING_WORD_MAX_LENGTH or len(reading) > READING_MAX_LENGTH:
+            await interaction.response.send_message(
+                f"単語は{READING_WORD_MAX_LENGTH}文字、読みは{READING_MAX_LENGTH}文字までです。", ephemeral=True)
+            return
+        entries = self.entries.setdefault(str(interaction.guild.id), {})
+        if key not in entries and len(entries) >= READING_DICT_MAX_ENTRIES:
+            await interaction.response.send_message(
+                f"辞書は{READING_DICT_MAX_ENTRIES}件までです。/dict_remove で不要な単語を削除してください。", ephemeral=True)
+            return
+        entries[key] = reading
+        self.update(interaction.guild.id)
+        await interaction.response.send_message(f"📖 「{key}」を「{reading}」と読みます。", ephemeral=True)
+
+    @app_commands.command(name="dict_remove", description="読み上げ辞書から単語を削除します")
+    @app_commands.describe(word="削除する単語")
+    @app_commands.guild_only()
+    async def dict_remove(self, interaction: discord.Interaction, word: str):
+        key = normalize_word(word)
+        entries = self.entries.get(str(interaction.guild.id), {})
+        if key not in entries:
+            await interaction.response.send_message(f"「{key}」は登録されていません。", ephemeral=True)
+            return
+        del entries[key]
+        if not entries:
+            del self.entries[str(interaction.guild.id)]
+        self.update(interaction.guild.id)
+        await interaction.response.send_message(f"🗑️ 「{key}」を辞書から削除しました。", ephemeral=True)
+
+    @app_commands.command(name="dict_list", description="このサーバーの読み上げ辞書を表示します")
+    @app_commands.guild_only()
+    async def dict_list(self, interaction: discord.Interaction):
+        entries = self.entries.get(str(interaction.guild.id), {})
+        if not entries:
+            await interaction.response.send_message("辞書に登録された単語はありません。", ephemeral=True)
+            return
+        lines = [f"📖 **読み上げ辞書**（{len(entries)}/{READING_DICT_MAX_ENTRIES}件）"]
+        length = len(lines[0])
+        for word, reading in sorted(entries.items()):
+            line = f"・{word} → {reading}"
+            if length + len(line) + 1 > DICT_LIST_MAX_LENGTH:
+                lines.append("…（以下省略）")
+                break
+            lines.append(line)
+            length += len(line) + 1
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+async def setup(bot):
+    await bot.add_cog(ReadingDictionary(bot))
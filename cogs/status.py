@@ -38,6 +38,16 @@ class Status(commands.Cog):
         embed.add_field(name="CPU使用率", value=f"{cpu}%", inline=True)
         embed.add_field(name="メモリ", value=f"{mem.used // (1024 * 1024)}MB / {mem.total // (1024 * 1024)}MB", inline=True)
         embed.add_field(name="PING", value=f"{ping}ms", inline=True)
+
+        join_cog = self.bot.get_cog("Join")
+        if join_cog:
+            for url, engine in join_cog.voicevox.metrics().items():
+                lines = [f"{'🟢 正常' if engine['healthy'] else '🔴 切り離し中'}・処理中{engine['outstanding']}件"]
+                lines += [
+                    f"{path}: {m['count']}回 p50 {m['p50_ms']}ms / p95 {m['p95_ms']}ms（失敗{m['errors']}・再試行{m['retries']}）"
+                    for path, m in engine["paths"].items()
+                ]
+                embed.add_field(name=f"VOICEVOX {url}", value="\n".join(lines), inline=False)
         return embed
 
     @tasks.loop(seconds=3)
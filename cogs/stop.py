@@ -17,7 +17,7 @@ class Stop(commands.Cog):
         music_cog = self.bot.get_cog('Music')
         if music_cog:
             try:
-                await music_cog.stop_all()
+                await music_cog.stop_all(interaction.guild)
                 stopped_services.append("Music")
             except Exception as e:
                 print(f"Music停止エラー: {e}")
@@ -58,13 +58,8 @@ class Stop(commands.Cog):
                         print(f"Join VC切断エラー: {e}")
                     stopped_services.append("Join")
                 
-                # TTSタスクの停止
-                if join_cog.tts_task and not join_cog.tts_task.done():
-                    join_cog.tts_task.cancel()
-                    join_cog.tts_task = None
-                
-                # キャンセルイベントの設定
-                join_cog.cancel_event.set()
+                # このギルドの読み上げパイプラインの停止
+                await join_cog.close_pipeline(interaction.guild.id)
                 
                 # パネル情報のクリア
                 guild_id = str(interaction.guild.id)
@@ -87,6 +82,11 @@ class Stop(commands.Cog):
 
         if hasattr(self.bot, 'current_running_cog'):
             self.bot.current_running_cog = None
+            # 他のギルドで音楽再生・読み上げが続いている場合はその占有を維持
+            if music_cog and any(p.is_active() for p in music_cog.players.values()):
+                self.bot.current_running_cog = "Music"
+            elif join_cog and join_cog.pipelines:
+                self.bot.current_running_cog = "Join"
         
         # 結果メッセージ
         if stopped_services:
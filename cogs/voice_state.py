@@ -0,0 +1,107 @@
+from discord.ext import commands
+
+class VoiceStateIndex(commands.Cog):
+    """
+    on_voice_state_update からVCの在室状況を保持する索引。
+    guild.members を走査せずに「ユーザーはどのVCにいるか」「このVCは空か」をO(1)で引ける。
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.channels = {}  # guild_id: {channel_id: set(member_id)}
+        self.locations = {}  # guild_id: {member_id: channel_id}
+        self.bot_ids = set()  # Botアカウントのmember_id（人数に数えない）
+
+        # on_ready後にロードされるので、その時点の状態から作る
+        if self.bot.is_ready():
+            for guild in self.bot.guilds:
+                self.rebuild_guild(guild)
+
+    def rebuild_guild(self, guild):
+        self.channels.pop(guild.id, None)
+        self.locations.pop(guild.id, None)
+        for channel in list(guild.voice_channels) + list(guild.stage_channels):
+            for member_id in channel.voice_states:
+                member = guild.get_member(member_id)
+                is_bot = member.bot if member else (self.bot.user is not None and member_id == self.bot.user.id)
+                self._move(guild.id, member_id, channel.id, is_bot)
+
+    def _move(self, guild_id, member_id, channel_id, is_bot=False):
+        locations = self.locations.setdefault(guild_id, {})
+        channels = self.channels.setdefault(guild_id, {})
+        previous = locations.pop(member_id, None)
+        if previous is not None:
+            members = channels.get(previous)
+            if members is not None:
+                members.discard(member_id)
+                if not members:
+                    del channels[previous]
+        if is_bot:
+            self.bot_ids.add(member_id)
+        if channel_id is not None:
+            locations[member_id] = channel_id
+            channels.setdefault(channel_id, set()).add(member_id)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        self._move(member.guild.id, member.id, after.channel.id if after.channel else None, member.bot)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # 再接続時は取りこぼしがあり得るので作り直す
+        for guild in self.bot.guilds:
+            self.rebuild_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild):
+        self.rebuild_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.channels.pop(guild.id, None)
+        self.locations.pop(guild.id, None)
+
+    def channel_id_of(self, guild_id, user_id):
+        return self.locations.get(guild_id, {}).get(user_id)
+
+    def channel_of(self, guild, user_id):
+        channel_id = self.channel_id_of(guild.id, user_id)
+        return guild.get_channel(channel_id) if channel_id is not None else None
+
+    def members_in(self, guild_id, channel_id):
+        return frozenset(self.channels.get(guild_id, {}).get(channel_id, ()))
+
+    def human_count(self, guild_id, channel_id):
+        members = self.channels.get(guild_id, {}).get(channel_id, ())
+        return sum(1 for member_id in members if member_id not in self.bot_ids)
+
+    def is_empty(self, guild_id, channel_id):
+        """
+        Bot以外が誰もいなければTrue
+        """
+        return self.human_count(guild_id, channel_id) == 0
+
+    def occupied_channel(self, guild):
+        """
+        人がいるVCを1つ返す（要求者の居場所が分からないときの代わり）
+        """
+        for channel_id in self.channels.get(guild.id, {}):
+            if not self.is_empty(guild.id, channel_id):
+                channel = guild.get_channel(channel_id)
+                if channel:
+                    return channel
+        return None
+
+def find_user_voice_channel(bot, guild, user):
+    """
+    ユーザーが参加しているVCを返す。索引Cogが無ければ interaction.user.voice にフォールバック
+    """
+    index = bot.get_cog("VoiceStateIndex")
+    if index:
+        channel = index.channel_of(guild, user.id)
+        if channel:
+            return channel
+    voice = getattr(user, "voice", None)
+    return voice.channel if voice and voice.channel else None
+
+async def setup(bot):
+    await bot.add_cog(VoiceStateIndex(bot))
@@ -4,6 +4,10 @@ load_dotenv()
 
 FFMPEG_PATH = FFMPEG_PATH = "C:/Users/reito/Desktop/Share/01_program/DIscordBOT/ffmpeg-file/bin/ffmpeg.exe"
 VOICEVOX_PATH = r"C:\Users\reito\Desktop\Share\01_program\DIscordBOT\windows-cpu\run.exe"
+VOICEVOX_ENGINE_COUNT = 1  # 起動するVOICEVOXエンジンの数（ポートは VOICEVOX_BASE_PORT から連番）
+VOICEVOX_BASE_PORT = 50021
+# 読み上げに使うエンジン。別のマシンのエンジンも使うときはURLを直接並べる
+VOICEVOX_ENDPOINTS = [f"http://localhost:{VOICEVOX_BASE_PORT + i}" for i in range(VOICEVOX_ENGINE_COUNT)]
 
 # 依存
 DISCORD_TOKEN = "***************"
@@ -16,3 +20,8 @@ LUCKY_ITEMS_PATH = f"{MEMORY_DIR}/lucky_items.json"
 FORTUNE_MESSAGES_PATH = f"{MEMORY_DIR}/fortune_messages.json"
 SETTINGS_PATH = f"{MEMORY_DIR}/settings.json"
 PINNED_MESSAGES_PATH = "memory/pinned_messages.json"
+APPLE_MUSIC_CACHE_PATH = f"{MEMORY_DIR}/apple_music_cache.json"
+SEARCH_CACHE_PATH = f"{MEMORY_DIR}/search_cache.json"
+AUDIO_CACHE_INDEX_PATH = f"{MEMORY_DIR}/audio_cache.json"
+TTS_CACHE_DIR = f"{MEMORY_DIR}/tts_cache"
+READING_DICT_PATH = f"{MEMORY_DIR}/reading_dict.json"
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from cogs import music
+
+def make_track(name):
+    return SimpleNamespace(name=name, expire=None, is_fresh=lambda: True)
+
+class FakeYoutubeDL:
+    """
+    yt_dlp.YoutubeDL の代わり。呼ばれたURLを順に記録する
+    """
+    calls = []
+    lock = threading.Lock()
+
+    def __init__(self, opts):
+        pass
+
+    def extract_info(self, url, download=False):
+        with self.lock:
+            self.calls.append(url)
+        time.sleep(0.1 if url == "block" else 0.01)
+        return {"id": url}
+
+    def close(self):
+        pass
+
+def test_same_id_at_different_priorities_is_extracted_once(monkeypatch):
+    FakeYoutubeDL.calls = []
+    monkeypatch.setattr(music.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+
+    async def scenario():
+        pool = music.ExtractorPool(workers=1)
+        cache = music.ExtractCache()
+
+        def resolve(video_id, priority):
+            async def load(priority):
+                info = await pool.extract(video_id, {}, priority=priority, key=video_id)
+                return make_track(info["id"])
+            return cache.get_or_load(
+                video_id, load, priority, lambda p: pool.raise_priority(video_id, p))
+
+        # ワーカーを塞いでおき、その間に積んだジョブの順番を見る
+        blocker = asyncio.ensure_future(pool.extract("block", {}))
+        await asyncio.sleep(0.02)
+        metadata = asyncio.ensure_future(resolve("a", music.PRIORITY_METADATA))
+        prefetch = asyncio.ensure_future(resolve("b", music.PRIORITY_PREFETCH))
+        await asyncio.sleep(0)
+        prefetch_a = asyncio.ensure_future(resolve("a", music.PRIORITY_PREFETCH))
+        now_playing = await resolve("a", music.PRIORITY_NOW_PLAYING)
+        results = await asyncio.gather(metadata, prefetch_a, prefetch, blocker)
+        pool.shutdown()
+        return now_playing, results
+
+    now_playing, (metadata, prefetch_a, _, _) = asyncio.run(scenario())
+    assert FakeYoutubeDL.calls == ["block", "a", "b"]
+    assert now_playing is metadata is prefetch_a
+
+def test_joined_request_reloads_when_shared_job_is_rejected():
+    loads = []
+
+    async def scenario():
+        cache = music.ExtractCache()
+
+        async def rejected(priority):
+            loads.append("metadata")
+            await asyncio.sleep(0.01)
+            raise music.ExtractQueueFull("満杯")
+
+        async def load(priority):
+            loads.append(priority)
+            return make_track("a")
+
+        background = asyncio.ensure_future(cache.get_or_load("a", rejected, music.PRIORITY_METADATA))
+        await asyncio.sleep(0)
+        track = await cache.get_or_load("a", load, music.PRIORITY_NOW_PLAYING)
+        with pytest.raises(music.ExtractQueueFull):
+            await background
+        return track
+
+    track = asyncio.run(scenario())
+    assert track.name == "a"
+    assert loads == ["metadata", music.PRIORITY_NOW_PLAYING]
+
+def test_concurrent_requests_share_one_load():
+    loads = []
+
+    async def scenario():
+        cache = music.ExtractCache()
+
+        async def load(priority):
+            loads.append(priority)
+            await asyncio.sleep(0.01)
+            return make_track("a")
+
+        tracks = await asyncio.gather(*(cache.get_or_load("a", load) for _ in range(5)))
+        return tracks, await cache.get_or_load("a", load)
+
+    tracks, cached = asyncio.run(scenario())
+    assert loads == [music.PRIORITY_NOW_PLAYING]
+    assert all(track is cached for track in tracks)
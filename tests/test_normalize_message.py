@@ -0,0 +1,18 @@
+from types import SimpleNamespace
+
+from cogs.join import normalize_message
+
+BOT = SimpleNamespace(get_cog=lambda name: None)
+
+def normalize(content):
+    message = SimpleNamespace(guild=None, content=content, attachments=[], stickers=[])
+    return normalize_message(BOT, message)
+
+def test_digit_runs_are_kept():
+    assert normalize("10000円です") == "10000円です"
+    assert normalize("2000000") == "2000000"
+    assert normalize("11111") == "11111"
+
+def test_laughter_and_long_vowels_are_collapsed():
+    assert normalize("ｗｗｗｗｗｗ") == "www"
+    assert normalize("すごーーーーーい！！！！") == "すごーーーい!!!"
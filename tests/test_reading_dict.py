@@ -0,0 +1,38 @@
+import random
+
+from cogs.reading_dict import AhoCorasick
+
+def test_leftmost_longest_match_wins():
+    matcher = AhoCorasick({"ab": "X", "abc": "Y", "bcd": "Z", "c": "W"})
+    assert matcher.replace("abcd") == "Yd"
+    assert matcher.replace("xbcdc") == "xZW"
+
+def test_matching_ignores_case_but_keeps_unmatched_text():
+    matcher = AhoCorasick({"discord": "ディスコード"})
+    assert matcher.replace("Discordで DISCORD!") == "ディスコードで ディスコード!"
+    assert matcher.replace("Disc") == "Disc"
+
+def test_empty_dictionary_returns_text_unchanged():
+    assert AhoCorasick({}).replace("そのまま") == "そのまま"
+
+def brute_force(entries, text):
+    parts = []
+    i = 0
+    while i < len(text):
+        for length in range(len(text) - i, 0, -1):
+            if text[i:i + length] in entries:
+                parts.append(entries[text[i:i + length]])
+                i += length
+                break
+        else:
+            parts.append(text[i])
+            i += 1
+    return "".join(parts)
+
+def test_matches_brute_force_on_random_inputs():
+    rng = random.Random(0)
+    for _ in range(500):
+        words = {"".join(rng.choices("abc", k=rng.randint(1, 4))) for _ in range(rng.randint(1, 6))}
+        entries = {word: word.upper() for word in words}
+        text = "".join(rng.choices("abcd", k=rng.randint(0, 20)))
+        assert AhoCorasick(entries).replace(text) == brute_force(entries, text)
@@ -0,0 +1,23 @@
+from cogs.join import TTS_CHUNK_MAX_TEXT, split_tts_chunks
+
+TEXT = "今日はいい天気ですね、散歩に行きましょう。公園でお弁当を食べて、それから図書館で本を読みます。夕方には帰ります。"
+
+def test_short_text_is_not_split():
+    assert split_tts_chunks("  こんにちは  ") == ["こんにちは"]
+    assert split_tts_chunks("   ") == []
+
+def test_first_chunk_is_the_first_clause():
+    assert split_tts_chunks(TEXT) == [
+        "今日はいい天気ですね、",
+        "散歩に行きましょう。公園でお弁当を食べて、それから図書館で本を読みます。",
+        "夕方には帰ります。",
+    ]
+
+def test_long_clause_is_cut_at_max_length():
+    chunks = split_tts_chunks("あ" * 200)
+    assert "".join(chunks) == "あ" * 200
+    assert all(len(chunk) <= TTS_CHUNK_MAX_TEXT for chunk in chunks)
+
+def test_symbols_only_text_is_kept_as_is():
+    text = "、、、。。。！！！？？？……・・・ーーー"
+    assert split_tts_chunks(text) == [text]
@@ -0,0 +1,71 @@
+import asyncio
+import io
+import wave
+import zipfile
+
+import pytest
+
+from cogs import join
+
+def make_wav(frames=240):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(24000)
+        w.writeframes(b"\x00\x01" * frames)
+    return buffer.getvalue()
+
+def make_zip(wavs):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for i, wav in enumerate(wavs):
+            archive.writestr(f"{i + 1:03}.wav", wav)
+    return buffer.getvalue()
+
+class StubVoicevox(join.VoicevoxClient):
+    """
+    HTTPの代わりに決まった応答を返す VoicevoxClient
+    """
+    def __init__(self, multi_response):
+        super().__init__()
+        self.multi_response = multi_response
+        self.paths = []
+
+    async def request(self, method, path, *, params=None, json=None, response="json"):
+        self.paths.append(path)
+        if path == "/audio_query":
+            return {"text": params["text"]}
+        if path == "/synthesis":
+            return make_wav()
+        if path == "/multi_synthesis":
+            return self.multi_response(json)
+        raise AssertionError(path)
+
+def make_join(voicevox):
+    cog = join.Join.__new__(join.Join)
+    cog.voicevox = voicevox
+    cog.synthesis_cache = join.SynthesisCache(disk_enabled=False)
+    cog.synthesis_slots = join.SynthesisSlots(2)
+    return cog
+
+def synthesize_many(voicevox, texts):
+    return asyncio.run(make_join(voicevox).synthesize_many(texts, 1, 1.0))
+
+def test_merged_synthesis_uses_one_request():
+    voicevox = StubVoicevox(lambda queries: make_zip([make_wav() for _ in queries]))
+    results = synthesize_many(voicevox, ["おはよう", "こんにちは", "こんばんは"])
+    assert voicevox.paths.count("/multi_synthesis") == 1
+    assert "/synthesis" not in voicevox.paths
+    assert results == [join.wav_to_discord_pcm(make_wav())] * 3
+
+@pytest.mark.parametrize("multi_response", [
+    lambda queries: b"not a zip",  # ZIPではない
+    lambda queries: make_zip([b"RIFF"] * len(queries)),  # WAVが壊れている
+    lambda queries: make_zip([make_wav()]),  # 件数が足りない
+])
+def test_broken_merged_response_falls_back_to_each_text(multi_response):
+    voicevox = StubVoicevox(multi_response)
+    results = synthesize_many(voicevox, ["おはよう", "こんにちは"])
+    assert voicevox.paths.count("/synthesis") == 2
+    assert results == [join.wav_to_discord_pcm(make_wav())] * 2